@@ -91,6 +91,12 @@ def videos_json():
     return send_from_directory("video_creation/data", "videos.json")
 
 
+# Make the progress of the running render accessible
+@app.route("/progress.json")
+def progress_json():
+    return send_from_directory("video_creation/data", "progress.json")
+
+
 # Make backgrounds.json accessible
 @app.route("/backgrounds.json")
 def backgrounds_json():
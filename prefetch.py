@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+import argparse
+
+from utils.console import print_step, print_substep
+from video_creation.background import prefetch_backgrounds
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Download and verify every background video and audio ahead of time."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="how many backgrounds to download at once"
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="re-check the checksum of downloaded backgrounds and replace corrupted ones",
+    )
+    args = parser.parse_args()
+
+    print_step("Prefetching the backgrounds... please be patient 🙏")
+    results = prefetch_backgrounds(workers=args.workers, verify=args.verify, quiet=True)
+    print_substep(
+        f"{results['downloaded']} downloaded, {results['ready']} already there, "
+        f"{results['failed']} failed",
+        style="bold red" if results["failed"] else "bold green",
+    )
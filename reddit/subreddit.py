@@ -1,53 +1,188 @@
 import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import List, Optional
 
 from prawcore.exceptions import ResponseException
 
-from utils import settings
+from utils import metrics, reddit_cache, settings
 import praw
 from praw.models import MoreComments
 from prawcore.exceptions import ResponseException
 
 from utils.console import print_step, print_substep
+from utils.reddit_cache import CachedSubmission, load_submission, snapshot_submission
 from utils.subreddit import get_subreddit_undone
 from utils.videos import check_done
 from utils.voice import sanitize_text
 from utils.posttextparser import posttextparser
 from utils.ai_methods import sort_by_similarity
 
+_reddit = None
+_reddit_lock = threading.Lock()
+
+
+def get_reddit() -> praw.Reddit:
+    """Returns the Reddit client of this process, logging in the first time it is needed.
+
+    Every job of the process shares it, so the login and the access token (which praw renews by
+    itself when it expires) are only requested once instead of for every post.
+    """
+    global _reddit
+    with _reddit_lock:
+        if _reddit is not None:
+            return _reddit
+
+        print_substep("Logging into Reddit.")
+        if settings.config["reddit"]["creds"]["2fa"]:
+            print("\nEnter your two-factor authentication code from your authenticator app.\n")
+            code = input("> ")
+            print()
+            pw = settings.config["reddit"]["creds"]["password"]
+            passkey = f"{pw}:{code}"
+        else:
+            passkey = settings.config["reddit"]["creds"]["password"]
+        username = settings.config["reddit"]["creds"]["username"]
+        if str(username).casefold().startswith("u/"):
+            username = username[2:]
+        try:
+            _reddit = praw.Reddit(
+                client_id=settings.config["reddit"]["creds"]["client_id"],
+                client_secret=settings.config["reddit"]["creds"]["client_secret"],
+                user_agent="Accessing Reddit threads",
+                username=username,
+                passkey=passkey,
+                check_for_async=False,
+            )
+            metrics.increment("reddit.logins")
+        except ResponseException as e:
+            if e.response.status_code == 401:
+                print("Invalid credentials - please check them in config.toml")
+        except:
+            print("Something went wrong...")
+        return _reddit
+
+
+def set_comment_order(submission, wanted: int) -> None:
+    """Sets the sort and size of the first comment page of a submission that isn't loaded yet.
+
+    Args:
+        submission (praw.models.Submission): The post
+        wanted (int): How many comments are going to be used, -1 for all of them
+    """
+    submission.comment_sort = settings.config["reddit"]["thread"]["comment_sort"]
+    if wanted != -1:
+        # replies count against the limit as well, so leave room for them
+        submission.comment_limit = min(max(10 * wanted, 100), 500)
+
+
+def _eligible_comment(comment) -> bool:
+    if comment.body in ["[removed]", "[deleted]"]:
+        return False  # see https://github.com/JasonLovesDoggo/RedditVideoMakerBot/issues/78
+    if comment.stickied or comment.author is None:
+        return False
+    sanitised = sanitize_text(comment.body)
+    if not sanitised or sanitised == " ":
+        return False
+    return (
+        int(settings.config["reddit"]["thread"]["min_comment_length"])
+        <= len(comment.body)
+        <= int(settings.config["reddit"]["thread"]["max_comment_length"])
+    )
+
+
+def fetch_comments(submission, wanted: int) -> List[dict]:
+    """Collects the top level comments of a submission that can be read out, in the configured
+    comment order, and stops as soon as there are enough of them.
+
+    The first page comes with the post. Only when it doesn't hold enough comments are more of
+    them ("load more comments") requested, until comment_request_budget requests were made or
+    comment_replace_more_limit of those links were followed.
+
+    Args:
+        submission (praw.models.Submission): The post, see set_comment_order
+        wanted (int): How many comments to collect, -1 for as many as the budgets allow
+
+    Returns:
+        List[dict]: The comments, in the same format as content["comments"]
+    """
+    thread_config = settings.config["reddit"]["thread"]
+    request_budget = int(thread_config["comment_request_budget"])
+    more_budget = int(thread_config["comment_replace_more_limit"])
+
+    start = time.perf_counter()
+    comments = []
+    requests = 1  # the page loaded with the post
+    pending = deque(submission.comments)
+    while pending and (wanted == -1 or len(comments) < wanted):
+        comment = pending.popleft()
+        if not isinstance(comment, MoreComments):
+            if _eligible_comment(comment):
+                comments.append(
+                    {
+                        "comment_body": comment.body,
+                        "comment_url": comment.permalink,
+                        "comment_id": comment.id,
+                        "comment_author": comment.author.name,
+                        "comment_score": comment.score,
+                        "comment_edited": comment.edited,
+                    }
+                )
+            continue
+        if requests >= request_budget or more_budget == 0:
+            continue
+        requests += 1
+        more_budget -= 1
+        # the answer holds replies as well, only the top level comments are read out
+        pending.extend(c for c in comment.comments() if c.parent_id == submission.fullname)
+
+    elapsed = time.perf_counter() - start
+    metrics.observe("reddit.comment_fetch", elapsed)
+    metrics.increment("reddit.comment_requests", requests)
+    print_substep(
+        f"Fetched {len(comments)} comments in {elapsed:.1f}s with {requests} request(s)",
+        style="bold blue",
+    )
+    return comments
+
+
+@lru_cache(maxsize=1)
+def open_submission(reddit: praw.Reddit, submission_id: str):
+    """Returns a praw Submission that loads its first comments in the configured order.
+
+    The last one is kept, so the comments of a post that was just fetched come from the same
+    request.
+    """
+    submission = reddit.submission(id=submission_id)
+    # the first comments come with the post itself, so their order has to be set before it loads
+    set_comment_order(submission, settings.config["reddit"]["thread"]["max_comments"])
+    return submission
+
+
+def get_submission(reddit: Optional[praw.Reddit], submission_id: str) -> CachedSubmission:
+    """Returns a submission by its id through the cache (reddit is None when replaying)."""
+    return load_submission(
+        reddit_cache.cached(
+            "submission",
+            submission_id,
+            lambda: snapshot_submission(open_submission(reddit, submission_id)),
+        )
+    )
+
 
 def get_subreddit_threads(POST_ID: str):
     """
     Returns a list of threads from the AskReddit subreddit.
     """
 
-    print_substep("Logging into Reddit.")
-
     content = {}
-    if settings.config["reddit"]["creds"]["2fa"]:
-        print("\nEnter your two-factor authentication code from your authenticator app.\n")
-        code = input("> ")
-        print()
-        pw = settings.config["reddit"]["creds"]["password"]
-        passkey = f"{pw}:{code}"
-    else:
-        passkey = settings.config["reddit"]["creds"]["password"]
-    username = settings.config["reddit"]["creds"]["username"]
-    if str(username).casefold().startswith("u/"):
-        username = username[2:]
-    try:
-        reddit = praw.Reddit(
-            client_id=settings.config["reddit"]["creds"]["client_id"],
-            client_secret=settings.config["reddit"]["creds"]["client_secret"],
-            user_agent="Accessing Reddit threads",
-            username=username,
-            passkey=passkey,
-            check_for_async=False,
-        )
-    except ResponseException as e:
-        if e.response.status_code == 401:
-            print("Invalid credentials - please check them in config.toml")
-    except:
-        print("Something went wrong...")
+    # a replay runs from the cache alone, without logging in
+    reddit = None if settings.config["reddit"]["thread"]["reddit_replay"] else get_reddit()
+
+    def open_subreddit(name: str):
+        return reddit.subreddit(name) if reddit else name
 
     # Ask user for subreddit input
     print_step("Getting subreddit threads...")
@@ -56,12 +191,12 @@ def get_subreddit_threads(POST_ID: str):
         "subreddit"
     ]:  # note to user. you can have multiple subreddits via reddit.subreddit("redditdev+learnpython")
         try:
-            subreddit = reddit.subreddit(
+            subreddit = open_subreddit(
                 re.sub(r"r\/", "", input("What subreddit would you like to pull from? "))
                 # removes the r/ from the input
             )
         except ValueError:
-            subreddit = reddit.subreddit("askreddit")
+            subreddit = open_subreddit("askreddit")
             print_substep("Subreddit not defined. Using AskReddit.")
     else:
         sub = settings.config["reddit"]["thread"]["subreddit"]
@@ -69,18 +204,18 @@ def get_subreddit_threads(POST_ID: str):
         subreddit_choice = sub
         if str(subreddit_choice).casefold().startswith("r/"):  # removes the r/ from the input
             subreddit_choice = subreddit_choice[2:]
-        subreddit = reddit.subreddit(subreddit_choice)
+        subreddit = open_subreddit(subreddit_choice)
 
     if POST_ID:  # would only be called if there are multiple queued posts
-        submission = reddit.submission(id=POST_ID)
+        submission = get_submission(reddit, POST_ID)
 
     elif (
         settings.config["reddit"]["thread"]["post_id"]
         and len(str(settings.config["reddit"]["thread"]["post_id"]).split("+")) == 1
     ):
-        submission = reddit.submission(id=settings.config["reddit"]["thread"]["post_id"])
+        submission = get_submission(reddit, settings.config["reddit"]["thread"]["post_id"])
     elif settings.config["ai"]["ai_similarity_enabled"]:  # ai sorting based on comparison
-        threads = subreddit.hot(limit=50)
+        threads = reddit_cache.get_listing(subreddit, "hot", limit=50)
         keywords = settings.config["ai"]["ai_similarity_keywords"].split(",")
         keywords = [keyword.strip() for keyword in keywords]
         # Reformat the keywords for printing
@@ -91,13 +226,14 @@ def get_subreddit_threads(POST_ID: str):
             threads, subreddit, similarity_scores=similarity_scores
         )
     else:
-        threads = subreddit.hot(limit=25)
+        threads = reddit_cache.get_listing(subreddit, "hot", limit=25)
         submission = get_subreddit_undone(threads, subreddit)
 
     if submission is None:
-        return get_subreddit_threads(POST_ID)  # submission already done. rerun
+        print_substep("All submissions have been done. Try another subreddit.")
+        exit()
 
-    elif not submission.num_comments and settings.config["settings"]["storymode"] == "false":
+    if not submission.num_comments and settings.config["settings"]["storymode"] == "false":
         print_substep("No comments found. Skipping.")
         exit()
 
@@ -123,6 +259,11 @@ def get_subreddit_threads(POST_ID: str):
     content["thread_title"] = submission.title
     content["thread_id"] = submission.id
     content["is_nsfw"] = submission.over_18
+    content["thread_author"] = submission.author.name if submission.author else "[deleted]"
+    content["thread_score"] = upvotes
+    content["thread_num_comments"] = num_comments
+    content["thread_subreddit"] = submission.subreddit.display_name
+    content["thread_edited"] = submission.edited
     content["comments"] = []
     max_comments_download = settings.config["reddit"]["thread"]["max_comments"]
     if settings.config["settings"]["storymode"]:
@@ -131,44 +272,20 @@ def get_subreddit_threads(POST_ID: str):
         else:
             content["thread_post"] = submission.selftext
     else:
-        
-        comments_added = 0
-        
-        for top_level_comment in submission.comments:
-            if isinstance(top_level_comment, MoreComments):
-                continue
-
-            if top_level_comment.body in ["[removed]", "[deleted]"]:
-                continue  # # see https://github.com/JasonLovesDoggo/RedditVideoMakerBot/issues/78
-            if not top_level_comment.stickied:
-                sanitised = sanitize_text(top_level_comment.body)
-                if not sanitised or sanitised == " ":
-                    continue
-                if len(top_level_comment.body) <= int(
-                    settings.config["reddit"]["thread"]["max_comment_length"]
-                ):
-                    if len(top_level_comment.body) >= int(
-                        settings.config["reddit"]["thread"]["min_comment_length"]
-                    ):
-                        if (
-                            top_level_comment.author is not None
-                            and sanitize_text(top_level_comment.body) is not None
-                        ):  # if errors occur with this change to if not.
-                            
-                            
-                            if max_comments_download != -1 and comments_added >= max_comments_download:
-                                break  # Break the loop if the max limit is reached
-
-                            
-                            content["comments"].append(
-                                {
-                                    "comment_body": top_level_comment.body,
-                                    "comment_url": top_level_comment.permalink,
-                                    "comment_id": top_level_comment.id,
-                                }
-                            )
-                            
-                            comments_added += 1
+        thread_config = settings.config["reddit"]["thread"]
+        content["comments"] = reddit_cache.cached(
+            "comments",
+            reddit_cache.cache_key(
+                submission.id,
+                max_comments_download,
+                thread_config["comment_sort"],
+                thread_config["min_comment_length"],
+                thread_config["max_comment_length"],
+                thread_config["comment_request_budget"],
+                thread_config["comment_replace_more_limit"],
+            ),
+            lambda: fetch_comments(open_submission(reddit, submission.id), max_comments_download),
+        )
 
     print_substep("Received subreddit threads Successfully.", style="bold green")
     return content
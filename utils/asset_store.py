@@ -0,0 +1,124 @@
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Optional
+
+from utils import metrics
+from utils.background_index import file_checksum
+
+STORE_DIR = "assets/store"
+
+
+def blob_path(digest: str, suffix: str = "") -> Path:
+    """Returns where the blob with the given sha256 is stored."""
+    return Path(STORE_DIR) / "blobs" / digest[:2] / f"{digest}{suffix}"
+
+
+def _try_link(source: str, destination: str) -> bool:
+    """Puts a hardlink to source at destination in one step.
+
+    Returns:
+        bool: False where links don't work (another drive, or a file system without hardlinks)
+    """
+    temp_path = f"{destination}.{os.getpid()}.tmp"
+    try:
+        os.link(source, temp_path)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        return False
+    os.replace(temp_path, destination)
+    return True
+
+
+def link_file(source: str, destination: str) -> None:
+    """Puts a hardlink to source at destination in one step, or a copy where links don't work."""
+    if _try_link(source, destination):
+        return
+    temp_path = f"{destination}.{os.getpid()}.tmp"
+    shutil.copyfile(source, temp_path)
+    metrics.increment("asset_store.copies")
+    os.replace(temp_path, destination)
+
+
+def put(path: str, digest: Optional[str] = None) -> Optional[str]:
+    """Adds a file to the store. If the same content is already there, the file is replaced by a
+    hardlink to it, so every copy of an asset takes disk space only once.
+
+    The store only ever holds links, never copies: gc counts the links of a blob to know whether
+    it is still used. Where the file can't be linked into the store it is left alone.
+
+    Args:
+        path (str): The file to add
+        digest (Optional[str]): Its sha256, when it is already known
+
+    Returns:
+        Optional[str]: The sha256 of the file, or None when it couldn't be stored
+    """
+    digest = digest or file_checksum(path)
+    blob = blob_path(digest, Path(path).suffix)
+    if blob.is_file():
+        if not os.path.samefile(blob, path):
+            saved = os.stat(path).st_size
+            if _try_link(str(blob), path):
+                metrics.increment("asset_store.deduplicated_bytes", saved)
+        return digest
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    if not _try_link(path, str(blob)):
+        metrics.increment("asset_store.unlinkable")
+        return None
+    return digest
+
+
+def link(digest: str, destination: str, suffix: str = "") -> bool:
+    """Hardlinks a blob to destination, e.g. into the temp folder of a job.
+
+    Returns:
+        bool: Whether the blob exists and could be linked there
+    """
+    blob = blob_path(digest, suffix)
+    if not blob.is_file():
+        return False
+    Path(destination).parent.mkdir(parents=True, exist_ok=True)
+    try:
+        return _try_link(str(blob), destination)
+    except FileNotFoundError:
+        return False  # collected in the meantime
+
+
+def detach(path: str) -> None:
+    """Unlinks a file that is about to be rewritten if it shares its content with the store.
+
+    Writing into a hardlink changes every file linked to it, so anything that overwrites an asset
+    in place calls this first.
+    """
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def gc(min_age: float = 3600) -> int:
+    """Deletes the blobs nothing links to any more.
+
+    A blob's link count is its reference count: one for the store itself plus one for every file
+    linked to it, so a blob with a single link is garbage. Blobs younger than min_age seconds are
+    kept, so a blob that was just stored isn't collected before it is linked.
+
+    Returns:
+        int: How many bytes were freed
+    """
+    freed = 0
+    deadline = time.time() - min_age
+    for blob in Path(STORE_DIR, "blobs").glob("*/*"):
+        try:
+            stat = blob.stat()
+        except FileNotFoundError:
+            continue
+        if stat.st_nlink == 1 and stat.st_mtime < deadline:
+            blob.unlink(missing_ok=True)
+            freed += stat.st_size
+    metrics.increment("asset_store.gc_freed_bytes", freed)
+    return freed
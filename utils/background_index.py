@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import threading
+from bisect import bisect_right
+from typing import Optional
+
+import ffmpeg
+
+from utils import metrics
+
+BACKGROUND_DIR = "assets/backgrounds"
+INDEX_PATH = f"{BACKGROUND_DIR}/index.json"
+
+_lock = threading.Lock()
+
+
+def _load_index() -> dict:
+    try:
+        with open(INDEX_PATH, encoding="utf-8") as index_file:
+            return json.load(index_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_index(index: dict) -> None:
+    # written next to its destination first, so a crash never leaves half an index behind
+    os.makedirs(BACKGROUND_DIR, exist_ok=True)
+    temp_path = f"{INDEX_PATH}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as index_file:
+        json.dump(index, index_file, indent=4)
+    os.replace(temp_path, INDEX_PATH)
+
+
+def _frame_rate(rate: str) -> Optional[float]:
+    numerator, _, denominator = rate.partition("/")
+    try:
+        return float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def probe_background(path: str) -> dict:
+    """Reads the metadata of a background with ffprobe, including where its keyframes are.
+
+    Args:
+        path (str): The background video or audio file
+
+    Returns:
+        dict: duration (s), codec, and for videos width, height, fps and keyframes (timestamps
+        in seconds), or sample_rate for audio files
+    """
+    with metrics.timer("background.probe"):
+        probe = ffmpeg.probe(path)
+        info = {"duration": float(probe["format"]["duration"])}
+        video = next((s for s in probe["streams"] if s["codec_type"] == "video"), None)
+        if video is None:
+            audio = next(s for s in probe["streams"] if s["codec_type"] == "audio")
+            info.update(codec=audio["codec_name"], sample_rate=int(audio["sample_rate"]))
+            return info
+
+        info.update(
+            codec=video["codec_name"],
+            width=int(video["width"]),
+            height=int(video["height"]),
+            fps=_frame_rate(video.get("avg_frame_rate", "")),
+        )
+        # Only the packet headers are read, which is far quicker than decoding the video
+        packets = ffmpeg.probe(path, select_streams="v:0", show_entries="packet=pts_time,flags").get(
+            "packets", []
+        )
+        info["keyframes"] = [
+            float(packet["pts_time"])
+            for packet in packets
+            if "K" in packet.get("flags", "") and packet.get("pts_time", "N/A") != "N/A"
+        ]
+        info["keyframes"].sort()
+    return info
+
+
+def _index_key(path: str) -> str:
+    return os.path.relpath(path, BACKGROUND_DIR).replace(os.sep, "/")
+
+
+def _is_current(entry: Optional[dict], stat: os.stat_result) -> bool:
+    return bool(entry) and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size
+
+
+def file_checksum(path: str) -> str:
+    """Returns the sha256 of a file, read in chunks so large backgrounds don't fill the memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as background_file:
+        for chunk in iter(lambda: background_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_background_info(path: str) -> dict:
+    """Returns the indexed metadata of a background, probing it only when it is new or changed.
+
+    The index lives in assets/backgrounds/index.json and an entry is refreshed whenever the
+    modification time or size of its file changes.
+
+    Args:
+        path (str): The background video or audio file
+
+    Returns:
+        dict: See probe_background
+    """
+    stat = os.stat(path)
+    key = _index_key(path)
+    with _lock:
+        index = _load_index()
+        entry = index.get(key)
+        if _is_current(entry, stat):
+            metrics.increment("background.index.hits")
+            return entry
+        metrics.increment("background.index.misses")
+        entry = {"mtime": stat.st_mtime, "size": stat.st_size, **probe_background(path)}
+        index[key] = entry
+        _save_index(index)
+    return entry
+
+
+def verify_background(path: str) -> dict:
+    """Checks that a background is a complete, readable media file and records its checksum.
+
+    Args:
+        path (str): The background video or audio file
+
+    Raises:
+        ffmpeg.Error: When ffprobe can't read the file
+        ValueError: When the file has no duration, e.g. because it was cut off
+
+    Returns:
+        dict: The index entry of the background, including its sha256
+    """
+    stat = os.stat(path)
+    info = probe_background(path)
+    if not info["duration"] > 0:
+        raise ValueError(f"{path} has no duration")
+    entry = {"mtime": stat.st_mtime, "size": stat.st_size, **info, "sha256": file_checksum(path)}
+    with _lock:
+        index = _load_index()
+        index[_index_key(path)] = entry
+        _save_index(index)
+    return entry
+
+
+def is_verified(path: str) -> bool:
+    """Whether a background was verified and hasn't changed since, without reading it."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    with _lock:
+        entry = _load_index().get(_index_key(path))
+    return _is_current(entry, stat) and "sha256" in entry
+
+
+def checksum_matches(path: str) -> bool:
+    """Reads a verified background again and compares it with its recorded checksum."""
+    with _lock:
+        entry = _load_index().get(_index_key(path))
+    return bool(entry) and entry.get("sha256") == file_checksum(path)
+
+
+def move_background(source: str, destination: str) -> None:
+    """Moves a background into place in one step and carries its index entry along.
+
+    The entry takes the modification time and size of the moved file, since its content was
+    verified but the file may have been swapped for an identical one (see utils.asset_store).
+    """
+    os.replace(source, destination)
+    stat = os.stat(destination)
+    with _lock:
+        index = _load_index()
+        entry = index.pop(_index_key(source), None)
+        if entry:
+            index[_index_key(destination)] = {
+                **entry,
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+            }
+        _save_index(index)
+
+
+def snap_to_keyframe(info: dict, time: float) -> float:
+    """Moves a start time back to the keyframe at or before it, so a stream copy starts exactly
+    there instead of on the keyframe ffmpeg would pick. Unknown keyframes leave it unchanged.
+    """
+    keyframes = info.get("keyframes") or []
+    position = bisect_right(keyframes, time)
+    return keyframes[position - 1] if position else time
@@ -0,0 +1,191 @@
+import atexit
+import os
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+from playwright.sync_api import sync_playwright
+
+from utils import metrics, settings
+from utils.console import print_substep
+
+try:
+    import psutil
+except ImportError:  # Memory based recycling is only available with psutil installed
+    psutil = None
+
+
+def _child_pids() -> set:
+    if psutil is None:
+        return set()
+    return {child.pid for child in psutil.Process(os.getpid()).children(recursive=True)}
+
+
+class PooledBrowser:
+    """A warm Chromium instance and its bookkeeping."""
+
+    def __init__(self, browser, pid: Optional[int]):
+        self.browser = browser
+        self.pid = pid
+        self.uses = 0
+        self.open_contexts = 0
+        self.baseline_memory = self.memory()
+
+    def memory(self) -> Optional[int]:
+        """Returns the resident memory of the browser and all of its processes in bytes."""
+        if psutil is None or self.pid is None:
+            return None
+        try:
+            process = psutil.Process(self.pid)
+            return sum(p.memory_info().rss for p in [process, *process.children(recursive=True)])
+        except psutil.Error:
+            return None
+
+
+class BrowserPool:
+    """Keeps Chromium instances warm across jobs and hands out isolated browser contexts.
+
+    Playwright's sync API is bound to the thread it was started in, so a pool must only be used
+    from the thread that created it.
+
+    Args:
+        size (int): How many browsers may be open at once
+        max_uses (int): Contexts a browser hands out before it is replaced by a fresh one
+        max_memory_growth (int): Megabytes a browser may grow by before it is replaced, 0 disables
+        headless (bool): False shows the browsers for debugging purposes
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        max_uses: int = 25,
+        max_memory_growth: int = 512,
+        headless: bool = True,
+    ):
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.max_memory_growth = max_memory_growth * 1024 * 1024
+        self.headless = headless
+        self.browsers: List[PooledBrowser] = []
+        self._playwright = None
+
+    def _launch(self) -> PooledBrowser:
+        if self._playwright is None:
+            self._playwright = sync_playwright().start()
+        print_substep("Launching Headless Browser...")
+        before = _child_pids()
+        with metrics.timer("browser_pool.launch"):
+            browser = self._playwright.chromium.launch(headless=self.headless)
+        # The main chromium process is the new child whose parent isn't new as well
+        new_pids = _child_pids() - before
+        pid = None
+        for candidate in new_pids:
+            try:
+                if psutil.Process(candidate).ppid() not in new_pids:
+                    pid = candidate
+                    break
+            except psutil.Error:
+                continue
+        metrics.increment("browser_pool.launches")
+        pooled = PooledBrowser(browser, pid)
+        self.browsers.append(pooled)
+        return pooled
+
+    def _checkout(self) -> PooledBrowser:
+        idle = [pooled for pooled in self.browsers if pooled.open_contexts == 0]
+        if idle:
+            pooled = idle[0]
+        elif len(self.browsers) < self.size:
+            pooled = self._launch()
+        else:
+            pooled = min(self.browsers, key=lambda b: b.open_contexts)
+        pooled.uses += 1
+        pooled.open_contexts += 1
+        return pooled
+
+    def _checkin(self, pooled: PooledBrowser) -> None:
+        pooled.open_contexts -= 1
+        if pooled.open_contexts:
+            return
+        memory = pooled.memory()
+        grown = (
+            self.max_memory_growth
+            and memory is not None
+            and pooled.baseline_memory is not None
+            and memory - pooled.baseline_memory > self.max_memory_growth
+        )
+        if pooled.uses >= self.max_uses or grown or not pooled.browser.is_connected():
+            self._retire(pooled)
+            metrics.increment("browser_pool.recycles")
+
+    def _retire(self, pooled: PooledBrowser) -> None:
+        self.browsers.remove(pooled)
+        try:
+            pooled.browser.close()
+        except Exception:
+            pass  # The browser already crashed or was closed
+
+    @contextmanager
+    def context(self, **kwargs):
+        """Opens an isolated browser context on a warm browser, closing it afterwards.
+
+        Args:
+            kwargs: Passed on to Browser.new_context
+        """
+        pooled = self._checkout()
+        start = time.perf_counter()
+        self._record()
+        context = None
+        try:
+            # inside the try, so a browser that can't open a context is still checked in
+            context = pooled.browser.new_context(**kwargs)
+            yield context
+        finally:
+            try:
+                if context is not None:
+                    context.close()
+            finally:
+                self._checkin(pooled)
+                metrics.observe("browser_pool.context_lifetime", time.perf_counter() - start)
+                self._record()
+
+    def stats(self) -> dict:
+        """Returns the current utilization of the pool."""
+        open_contexts = sum(pooled.open_contexts for pooled in self.browsers)
+        busy = sum(1 for pooled in self.browsers if pooled.open_contexts)
+        return {
+            "browsers": len(self.browsers),
+            "size": self.size,
+            "open_contexts": open_contexts,
+            "utilization": busy / self.size,
+            "memory": sum(pooled.memory() or 0 for pooled in self.browsers),
+        }
+
+    def _record(self) -> None:
+        for name, value in self.stats().items():
+            metrics.gauge(f"browser_pool.{name}", value)
+
+    def close(self) -> None:
+        """Closes every browser and stops Playwright."""
+        for pooled in list(self.browsers):
+            self._retire(pooled)
+        if self._playwright is not None:
+            self._playwright.stop()
+            self._playwright = None
+
+
+_pool: Optional[BrowserPool] = None
+
+
+def get_browser_pool() -> BrowserPool:
+    """Returns the process wide browser pool, creating it from the config on first use."""
+    global _pool
+    if _pool is None:
+        browser_config = settings.config["settings"]["browser"]
+        _pool = BrowserPool(
+            size=int(browser_config["browser_pool_size"]),
+            max_uses=int(browser_config["browser_max_uses"]),
+            max_memory_growth=int(browser_config["browser_max_memory_growth"]),
+        )
+        atexit.register(_pool.close)
+    return _pool
@@ -0,0 +1,147 @@
+import re
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import ffmpeg
+
+from utils import metrics
+from utils.console import print_step, print_substep
+
+# Named speed/quality tiers of the final encode, from the fastest to the best looking.
+# fps None keeps the frame rate of the background, only draft caps it.
+PROFILES: Dict[str, dict] = {
+    "draft": {
+        "preset": "veryfast",
+        "crf": 28,
+        "gop_seconds": 2,
+        "pix_fmt": "yuv420p",
+        "fps": 30,
+    },
+    "standard": {
+        "preset": "medium",
+        "crf": 21,
+        "gop_seconds": 2,
+        "pix_fmt": "yuv420p",
+        "fps": None,
+    },
+    "archive": {
+        "preset": "slow",
+        "crf": 16,
+        "gop_seconds": 4,
+        "pix_fmt": "yuv420p",
+        "fps": None,
+    },
+}
+
+# Seconds of the video that are rendered to pick a profile in auto mode
+SAMPLE_SECONDS = 4
+
+
+def output_args(profile: dict, source_fps: float = 30) -> dict:
+    """Returns the ffmpeg output options of an encoding profile.
+
+    Args:
+        profile (dict): One of PROFILES
+        source_fps (float): The frame rate of the background, used when the profile keeps it
+
+    Returns:
+        dict: Keyword arguments for ffmpeg.output
+    """
+    fps = profile["fps"] or source_fps
+    args = {
+        "c:v": "libx264",
+        "preset": profile["preset"],
+        "pix_fmt": profile["pix_fmt"],
+        "g": max(1, round(fps * profile["gop_seconds"])),
+    }
+    if profile.get("crf") is not None:
+        args["crf"] = profile["crf"]
+    else:
+        args["b:v"] = profile["bitrate"]
+    if profile["fps"]:
+        args["r"] = profile["fps"]
+    return args
+
+
+def parse_renditions(renditions: str) -> List[Tuple[int, int]]:
+    """Parses a comma separated list of sizes like "1080x1920,720x1280,1080x1080".
+
+    Raises:
+        ValueError: When a size isn't WIDTHxHEIGHT with positive even numbers
+    """
+    sizes = []
+    for rendition in renditions.split(","):
+        if not rendition.strip():
+            continue
+        match = re.fullmatch(r"\s*(\d+)\s*[xX]\s*(\d+)\s*", rendition)
+        if not match:
+            raise ValueError(f"'{rendition}' is not a size like 1080x1920")
+        width, height = int(match.group(1)), int(match.group(2))
+        # x264 needs even dimensions for 4:2:0 video
+        if width <= 0 or height <= 0 or width % 2 or height % 2:
+            raise ValueError(f"The size {width}x{height} has to be made of positive even numbers")
+        if (width, height) not in sizes:
+            sizes.append((width, height))
+    return sizes
+
+
+def measure_ssim(distorted: str, reference: str, fps: Optional[int] = None) -> float:
+    """Returns the average SSIM (0 to 1) of an encode compared to its reference.
+
+    Args:
+        distorted (str): Path of the encoded video
+        reference (str): Path of the lossless reference
+        fps (Optional[int]): Frame rate the encode was converted to, the reference is matched to it
+    """
+    reference_stream = ffmpeg.input(reference)["v"]
+    if fps:
+        reference_stream = reference_stream.filter("fps", fps)
+    _, stderr = (
+        ffmpeg.filter([ffmpeg.input(distorted)["v"], reference_stream], "ssim")
+        .output("-", f="null")
+        .run(quiet=True)
+    )
+    match = re.search(r"All:([\d.]+)", stderr.decode("utf8", errors="replace"))
+    if not match:
+        raise ValueError(f"Could not read the SSIM of {distorted}")
+    return float(match.group(1))
+
+
+def pick_profile(video, reddit_id: str, quality_floor: float, source_fps: float = 30) -> str:
+    """Picks the fastest profile whose encode of a sample of the video reaches the quality floor.
+
+    The first SAMPLE_SECONDS of the video are rendered losslessly once, then encoded with every
+    profile from the fastest on until one is good enough.
+
+    Args:
+        video: The ffmpeg video stream that is going to be encoded
+        reddit_id (str): The ID of the reddit post, the samples go to its temp folder
+        quality_floor (float): The lowest acceptable SSIM (0 to 1)
+        source_fps (float): The frame rate of the background
+
+    Returns:
+        str: The name of the chosen profile
+    """
+    print_step("Picking an encoding profile...")
+    sample_dir = Path(f"assets/temp/{reddit_id}/encoding")
+    sample_dir.mkdir(parents=True, exist_ok=True)
+    reference = str(sample_dir / "reference.mkv")
+    ffmpeg.output(
+        video, reference, t=SAMPLE_SECONDS, **{"c:v": "libx264", "preset": "ultrafast", "qp": 0}
+    ).overwrite_output().run(quiet=True)
+
+    for name, profile in PROFILES.items():
+        sample = str(sample_dir / f"{name}.mp4")
+        start = time.perf_counter()
+        ffmpeg.output(
+            ffmpeg.input(reference)["v"], sample, **output_args(profile, source_fps)
+        ).overwrite_output().run(quiet=True)
+        metrics.observe(f"encoding.benchmark.{name}", time.perf_counter() - start)
+        ssim = measure_ssim(sample, reference, profile["fps"])
+        metrics.gauge(f"encoding.benchmark.{name}.ssim", ssim)
+        print_substep(f"{name}: SSIM {ssim:.4f}")
+        if ssim >= quality_floor:
+            return name
+    print_substep("No profile reached the quality floor, using the best one.", style="yellow")
+    return name
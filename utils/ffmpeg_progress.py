@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+import time
+from typing import IO, Iterator, Optional
+
+from tqdm import tqdm
+
+from utils import metrics
+
+# Where the GUI reads the progress of the running renders from
+GUI_PROGRESS_FILE = "video_creation/data/progress.json"
+
+
+def _number(value: str, suffix: str = "") -> Optional[float]:
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[: -len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None  # ffmpeg reports N/A until it knows
+
+
+def read_progress(
+    stream: IO[bytes], render: str, duration: Optional[float] = None
+) -> Iterator[dict]:
+    """Parses what ffmpeg writes to -progress pipe:1 into one event per progress block.
+
+    Args:
+        stream (IO[bytes]): The stdout of the ffmpeg process
+        render (str): The name of the render, passed along in every event
+        duration (Optional[float]): Length in seconds of the output, needed for percent and eta
+
+    Yields:
+        dict: render, frame, fps, bitrate (kbit/s), total_size (bytes), out_time (s),
+        dropped_frames, duplicated_frames, speed (x realtime), percent (0 to 1), eta (s),
+        elapsed (s) and done. Values ffmpeg doesn't know yet are None.
+    """
+    start = time.perf_counter()
+    block = {}
+    for raw_line in stream:
+        key, _, value = raw_line.decode("utf8", errors="replace").strip().partition("=")
+        if key != "progress":
+            block[key] = value
+            continue
+
+        elapsed = time.perf_counter() - start
+        out_time_us = _number(block.get("out_time_us", ""))
+        out_time = out_time_us / 1_000_000 if out_time_us is not None else None
+        speed = _number(block.get("speed", ""), "x")
+        percent = eta = None
+        if duration and out_time is not None:
+            percent = min(max(out_time / duration, 0), 1)
+            # ffmpeg's speed is averaged over the whole render, so it is a steady estimate
+            if speed:
+                eta = max(duration - out_time, 0) / speed
+        done = value == "end"
+        yield {
+            "render": render,
+            "frame": int(_number(block.get("frame", "")) or 0),
+            "fps": _number(block.get("fps", "")),
+            "bitrate": _number(block.get("bitrate", ""), "kbits/s"),
+            "total_size": int(_number(block.get("total_size", "")) or 0),
+            "out_time": out_time,
+            "dropped_frames": int(_number(block.get("drop_frames", "")) or 0),
+            "duplicated_frames": int(_number(block.get("dup_frames", "")) or 0),
+            "speed": speed,
+            "percent": 1.0 if done and duration else percent,
+            "eta": 0.0 if done else eta,
+            "elapsed": elapsed,
+            "done": done,
+        }
+        block = {}
+
+
+class CliProgress:
+    """Shows the progress events of a render as a tqdm bar with its throughput and eta."""
+
+    def __init__(self, desc: str = "Progress: "):
+        self.pbar = tqdm(total=100, desc=desc, bar_format="{l_bar}{bar}| {postfix}", unit=" %")
+
+    def __call__(self, event: dict) -> None:
+        if event["percent"] is not None:
+            self.pbar.update(round(event["percent"] * 100, 2) - self.pbar.n)
+        postfix = {}
+        if event["fps"] is not None:
+            postfix["fps"] = f"{event['fps']:g}"
+        if event["speed"] is not None:
+            postfix["speed"] = f"{event['speed']:g}x"
+        if event["eta"] is not None:
+            postfix["eta"] = f"{event['eta']:.0f}s"
+        if event["dropped_frames"]:
+            postfix["dropped"] = event["dropped_frames"]
+        self.pbar.set_postfix(postfix, refresh=False)
+        if event["done"]:
+            self.pbar.close()
+
+
+_gui_renders = {}
+_gui_lock = threading.Lock()
+
+
+def write_gui_progress(event: dict) -> None:
+    """Publishes the latest event of every render to GUI_PROGRESS_FILE for the GUI to poll.
+
+    The file is written next to its destination first and then moved into place, so the GUI
+    never reads a half written file.
+    """
+    with _gui_lock:
+        _gui_renders[event["render"]] = event
+        temp_path = f"{GUI_PROGRESS_FILE}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as progress_file:
+            json.dump({"updated": time.time(), "renders": _gui_renders}, progress_file)
+        os.replace(temp_path, GUI_PROGRESS_FILE)
+
+
+def clear_gui_progress() -> None:
+    """Forgets the renders of the previous video."""
+    with _gui_lock:
+        _gui_renders.clear()
+
+
+def record_metrics(event: dict) -> None:
+    """Records the throughput of a finished render in the metrics report."""
+    if not event["done"]:
+        return
+    metrics.observe("ffmpeg.render_time", event["elapsed"])
+    if event["fps"] is not None:
+        metrics.observe("ffmpeg.encode_fps", event["fps"], unit="fps")
+    if event["speed"] is not None:
+        metrics.observe("ffmpeg.speed", event["speed"], unit="x")
+    metrics.increment("ffmpeg.dropped_frames", event["dropped_frames"])
+    metrics.increment("ffmpeg.duplicated_frames", event["duplicated_frames"])
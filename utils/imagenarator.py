@@ -2,10 +2,17 @@ import re
 import textwrap
 import os
 import json
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import List, Tuple
 
-from PIL import Image, ImageDraw, ImageFont
+import translators
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
 from rich.progress import track
 from TTS.engine_wrapper import process_text
+from utils import asset_store, settings
 
 
 def load_text_replacements():
@@ -27,77 +34,302 @@ def perform_text_replacements(text):
     return updated_text
 
 
+# How far the outline of the transparent theme reaches around the text on a 1920 wide image
+SHADOW_SIZE = 4
+# The width story mode images used to be drawn at, font sizes are relative to it
+REFERENCE_WIDTH = 1920
+
+
+@lru_cache(maxsize=None)
+def load_font(name: str, size: int) -> ImageFont.FreeTypeFont:
+    """Loads one of the fonts in the fonts folder, every font and size is only read once"""
+    return ImageFont.truetype(os.path.join("fonts", name), size)
+
+
+@lru_cache(maxsize=4096)
+def layout_text(text: str, font: ImageFont.FreeTypeFont, wrap: int) -> Tuple[Tuple[str, int, int]]:
+    """
+    Wraps text and measures every line, so repeated text is only laid out once
+    """
+    return tuple((line, *font.getbbox(line)[2:]) for line in textwrap.wrap(text, width=wrap))
+
+
+def text_block_height(text, font, padding, wrap=50) -> int:
+    """
+    Returns how tall text is when drawn by draw_multiple_line_text
+    """
+    lines = layout_text(text, font, wrap)
+    if not lines:
+        return 0
+    text_height = font.getbbox(text)[3]
+    return math.ceil(
+        max(
+            (text_height + padding) * len(lines),
+            sum(line_height for _, _, line_height in lines) + padding * (len(lines) - 1),
+        )
+    )
+
+
 def draw_multiple_line_text(
-    image, text, font, text_color, padding, wrap=50, transparent=False
+    image, text, font, text_color, padding, wrap=50, transparent=False, shadow_size=SHADOW_SIZE
 ) -> None:
     """
     Draw multiline text over given image
     """
-    draw = ImageDraw.Draw(image)
-    Fontperm = font.getsize(text)
+    lines = layout_text(text, font, wrap)
+    if not lines:
+        return
     image_width, image_height = image.size
-    lines = textwrap.wrap(text, width=wrap)
-    y = (image_height / 2) - (((Fontperm[1] + (len(lines) * padding) / len(lines)) * len(lines)) / 2)
-    for line in lines:
-        line_width, line_height = font.getsize(line)
-        if transparent:
-            shadowcolor = "black"
-            for i in range(1, 5):
-                draw.text(
-                    ((image_width - line_width) / 2 - i, y - i),
-                    line,
-                    font=font,
-                    fill=shadowcolor,
-                )
-                draw.text(
-                    ((image_width - line_width) / 2 + i, y - i),
-                    line,
-                    font=font,
-                    fill=shadowcolor,
-                )
-                draw.text(
-                    ((image_width - line_width) / 2 - i, y + i),
-                    line,
-                    font=font,
-                    fill=shadowcolor,
-                )
-                draw.text(
-                    ((image_width - line_width) / 2 + i, y + i),
-                    line,
-                    font=font,
-                    fill=shadowcolor,
-                )
-        draw.text(((image_width - line_width) / 2, y), line, font=font, fill=text_color)
+    text_height = font.getbbox(text)[3]
+    y = (image_height / 2) - (((text_height + (len(lines) * padding) / len(lines)) * len(lines)) / 2)
+    positions = []
+    for line, line_width, line_height in lines:
+        positions.append(((image_width - line_width) / 2, y, line))
         y += line_height + padding
 
+    if transparent:
+        # Draw the text once as a mask and blur it into an outline, only around the text
+        mask = Image.new("L", image.size, 0)
+        mask_draw = ImageDraw.Draw(mask)
+        for x, y, line in positions:
+            mask_draw.text((x, y), line, font=font, fill=255)
+        left, top, right, bottom = mask.getbbox() or (0, 0, image_width, image_height)
+        box = (
+            max(left - shadow_size, 0),
+            max(top - shadow_size, 0),
+            min(right + shadow_size, image_width),
+            min(bottom + shadow_size, image_height),
+        )
+        shadow = (
+            mask.crop(box)
+            .filter(ImageFilter.GaussianBlur(shadow_size / 2))
+            .point(lambda value: min(255, value * 4))
+        )
+        image.paste("black", box, mask=shadow)
+
+    draw = ImageDraw.Draw(image)
+    for x, y, line in positions:
+        draw.text((x, y), line, font=font, fill=text_color)
+
+
+def render_image(
+    text, font_name, path, font_size, theme, txtclr, padding, width, transparent, shadow_size
+) -> None:
+    """
+    Render a single image, runs in the worker processes of imagemaker.
+    The image is as wide as its overlay and only as tall as the text, so no padding has to be
+    decoded and overlaid on every frame
+    """
+    font = load_font(font_name, font_size)
+    margin = max(shadow_size, font_size // 4)
+    height = text_block_height(text, font, padding, wrap=30) + 2 * margin
+    image = Image.new("RGBA", (width, height), theme)
+    draw_multiple_line_text(
+        image,
+        text,
+        font,
+        txtclr,
+        padding,
+        wrap=30,
+        transparent=transparent,
+        shadow_size=shadow_size,
+    )
+    save_image(image, path)
+
 
-def imagemaker(theme, reddit_obj: dict, txtclr, padding=5, transparent=False) -> None:
+def imagemaker(
+    theme, reddit_obj: dict, txtclr, padding=5, transparent=False, width=REFERENCE_WIDTH
+) -> None:
     """
-    Render Images for video
+    Render Images for video, width is the width of the images in the final video
     """
     title = process_text(perform_text_replacements(reddit_obj["thread_title"]), False)
-    texts = reddit_obj["thread_post"]
     id = re.sub(r"[^\w\s-]", "", reddit_obj["thread_id"])
 
-    if transparent:
-        font = ImageFont.truetype(os.path.join("fonts", "Roboto-Bold.ttf"), 100)
-        tfont = ImageFont.truetype(os.path.join("fonts", "Roboto-Bold.ttf"), 100)
+    def prepare(text):
+        return perform_text_replacements(process_text(text, False))
+
+    # translating is network bound, so the sentences are translated concurrently
+    if settings.config["reddit"]["thread"]["post_lang"]:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            texts = list(executor.map(prepare, reddit_obj["thread_post"]))
     else:
-        tfont = ImageFont.truetype(os.path.join("fonts", "Roboto-Bold.ttf"), 100)  # for title
-        font = ImageFont.truetype(os.path.join("fonts", "Roboto-Regular.ttf"), 100)
-    size = (1920, 1080)
+        texts = [prepare(text) for text in reddit_obj["thread_post"]]
+
+    font = "Roboto-Bold.ttf" if transparent else "Roboto-Regular.ttf"
+    scale = width / REFERENCE_WIDTH
+
+    render = partial(
+        render_image,
+        font_size=max(1, round(100 * scale)),
+        theme=theme,
+        txtclr=txtclr,
+        padding=max(1, round(padding * scale)),
+        width=width,
+        transparent=transparent,
+        shadow_size=max(1, round(SHADOW_SIZE * scale)),
+    )
+    # the title is rendered with the first batch of sentences
+    texts = [title] + texts
+    fonts = ["Roboto-Bold.ttf"] + [font] * (len(texts) - 1)
+    paths = [f"assets/temp/{id}/png/title.png"]
+    paths += [f"assets/temp/{id}/png/img{idx}.png" for idx in range(len(texts) - 1)]
+
+    workers = min(len(texts), os.cpu_count() or 1)
+    if workers <= 1:
+        for text, font_name, path in track(zip(texts, fonts, paths), "Rendering Image"):
+            render(text, font_name, path)
+        return
+    # rendering is CPU bound, so the images are spread over all cores. The workers are spawned
+    # on every platform, forking would copy the threads (prefetch, browser) of this process.
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        chunksize = max(1, len(texts) // (workers * 4))
+        for _ in track(
+            executor.map(render, texts, fonts, paths, chunksize=chunksize),
+            "Rendering Image",
+            total=len(texts),
+        ):
+            pass
+
+
+def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: int) -> List[str]:
+    """
+    Wraps text into lines that are at most max_width pixels wide when drawn with font.
+    Words wider than a whole line, like URLs, are broken between characters.
+    """
+    lines = []
+    for paragraph in text.splitlines():
+        line = ""
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if font.getlength(candidate) <= max_width:
+                line = candidate
+                continue
+            if line:
+                lines.append(line)
+            line = word
+            while len(line) > 1 and font.getlength(line) > max_width:
+                cut = len(line) - 1
+                while cut > 1 and font.getlength(line[:cut]) > max_width:
+                    cut -= 1
+                lines.append(line[:cut])
+                line = line[cut:]
+        if line:
+            lines.append(line)
+    return lines
+
+
+def format_score(score: int) -> str:
+    """Formats a score the way reddit shows it, e.g. 12345 -> 12.3k"""
+    if abs(score) < 1000:
+        return str(score)
+    return f"{score / 1000:.1f}k".replace(".0k", "k")
+
+
+def draw_card(width: int, header: str, body: str, footer: str, body_font, theme, txtclr):
+    """
+    Draws a reddit style card (a header line, the wrapped body and a footer line) that is
+    exactly width pixels wide and as tall as its content
+    """
+    padding = width // 25
+    small_font = load_font("Roboto-Medium.ttf", max(width // 32, 8))
+    # secondary text is halfway between the text and the background color
+    mutedclr = tuple((text + background) // 2 for text, background in zip(txtclr, theme[:3]))
+
+    lines = wrap_text(body, body_font, width - 2 * padding)
+    ascent, descent = body_font.getmetrics()
+    line_height = int((ascent + descent) * 1.25)
+    small_ascent, small_descent = small_font.getmetrics()
+    small_height = small_ascent + small_descent
+
+    height = 2 * padding + 2 * small_height + 2 * (padding // 2) + len(lines) * line_height
+    image = Image.new("RGBA", (width, height), theme)
+    draw = ImageDraw.Draw(image)
+
+    y = padding
+    draw.text((padding, y), header, font=small_font, fill=mutedclr)
+    y += small_height + padding // 2
+    for line in lines:
+        draw.text((padding, y), line, font=body_font, fill=txtclr)
+        y += line_height
+    y += padding // 2
+    draw.text((padding, y), footer, font=small_font, fill=mutedclr)
+    return image
+
+
+def save_image(image: Image.Image, path: str) -> None:
+    """Saves an image without writing into a cached image linked at the same path"""
+    asset_store.detach(path)
+    image.save(path)
+
+
+def cardmaker(
+    theme, reddit_obj: dict, txtclr, width: int, screenshot_num: int, missing=None
+) -> None:
+    """
+    Render the title and comment cards from the fetched reddit data, without a browser.
+    Only the file names in missing are rendered if it is given, the rest came from the cache.
+    """
+
+    def wanted(filename: str) -> bool:
+        return missing is None or filename in missing
+
+    id = re.sub(r"[^\w\s-]", "", reddit_obj["thread_id"])
+    lang = settings.config["reddit"]["thread"]["post_lang"]
+
+    def translate(text):
+        if not lang:
+            return text
+        return translators.translate_text(text, translator="google", to_language=lang)
+
+    title_font = load_font("Roboto-Bold.ttf", max(width // 20, 10))
+    body_font = load_font("Roboto-Regular.ttf", max(width // 24, 10))
 
-    image = Image.new("RGBA", size, theme)
+    if wanted("title.png"):
+        title = draw_card(
+            width,
+            f"r/{reddit_obj['thread_subreddit']} • Posted by u/{reddit_obj['thread_author']}",
+            translate(reddit_obj["thread_title"]),
+            f"{format_score(reddit_obj['thread_score'])} upvotes • "
+            f"{format_score(reddit_obj['thread_num_comments'])} comments",
+            title_font,
+            theme,
+            txtclr,
+        )
+        save_image(title, f"assets/temp/{id}/png/title.png")
 
-    # for title
-    draw_multiple_line_text(image, title, tfont, txtclr, padding, wrap=30, transparent=transparent)
+    if settings.config["settings"]["storymode"]:
+        if not wanted("story_content.png"):
+            return
+        story = draw_card(
+            width,
+            f"u/{reddit_obj['thread_author']}",
+            translate(reddit_obj["thread_post"]),
+            f"{format_score(reddit_obj['thread_score'])} upvotes",
+            body_font,
+            theme,
+            txtclr,
+        )
+        save_image(story, f"assets/temp/{id}/png/story_content.png")
+        return
 
-    image.save(f"assets/temp/{id}/png/title.png")
+    for idx, comment in track(
+        enumerate(reddit_obj["comments"][:screenshot_num]), "Rendering comments..."
+    ):
+        if not wanted(f"comment_{idx}.png"):
+            continue
+        card = draw_card(
+            width,
+            f"u/{comment['comment_author']}",
+            translate(comment["comment_body"]),
+            f"{format_score(comment['comment_score'])} points",
+            body_font,
+            theme,
+            txtclr,
+        )
+        save_image(card, f"assets/temp/{id}/png/comment_{idx}.png")
 
-    for idx, text in track(enumerate(texts), "Rendering Image"):
-        image = Image.new("RGBA", size, theme)
-        text = process_text(text, False)
-        draw_multiple_line_text(image, perform_text_replacements(text), font, txtclr, padding, wrap=30, transparent=transparent)
-        image.save(f"assets/temp/{id}/png/img{idx}.png")
 
-text_replacements = load_text_replacements()
\ No newline at end of file
+text_replacements = load_text_replacements()
@@ -0,0 +1,118 @@
+import json
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+from rich.table import Table
+
+from utils.console import console
+
+# Upper bounds (in seconds) of the latency histogram buckets, the last bucket catches the rest
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_samples: Dict[str, List[float]] = defaultdict(list)
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, float] = {}
+_units: Dict[str, str] = {}
+
+
+def observe(name: str, value: float, unit: str = "s") -> None:
+    """Records a sample (by default a latency in seconds) in the histogram called name."""
+    _samples[name].append(value)
+    _units[name] = unit
+
+
+def increment(name: str, amount: float = 1) -> None:
+    """Adds amount to the counter called name."""
+    _counters[name] += amount
+
+
+def gauge(name: str, value: float) -> None:
+    """Sets the gauge called name to its latest value."""
+    _gauges[name] = value
+
+
+@contextmanager
+def timer(name: str):
+    """Records how long the body of the with statement took in the histogram called name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def histogram(name: str) -> Dict[str, int]:
+    """Returns how many samples of the latency histogram called name fell into each bucket."""
+    counts = [0] * (len(LATENCY_BUCKETS) + 1)
+    for sample in _samples.get(name, []):
+        counts[bisect_left(LATENCY_BUCKETS, sample)] += 1
+    labels = [f"<={bound}s" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+    return dict(zip(labels, counts))
+
+
+def _percentile(samples: List[float], percent: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent))]
+
+
+def summary() -> dict:
+    """Returns every recorded metric as a JSON serializable dict."""
+    return {
+        "histograms": {
+            name: {
+                "count": len(samples),
+                "total": sum(samples),
+                "p50": _percentile(samples, 0.5),
+                "p95": _percentile(samples, 0.95),
+                "max": max(samples),
+                "unit": _units.get(name, "s"),
+                "buckets": histogram(name) if _units.get(name, "s") == "s" else {},
+            }
+            for name, samples in _samples.items()
+            if samples
+        },
+        "counters": dict(_counters),
+        "gauges": dict(_gauges),
+    }
+
+
+def print_report() -> None:
+    """Prints the recorded metrics as tables."""
+    data = summary()
+    if data["histograms"]:
+        table = Table(title="Histograms")
+        for column in ("metric", "count", "total", "p50", "p95", "max"):
+            table.add_column(column, justify="left" if column == "metric" else "right")
+        for name, values in sorted(data["histograms"].items()):
+            table.add_row(
+                name,
+                str(values["count"]),
+                *(f"{values[key]:.3f}{values['unit']}" for key in ("total", "p50", "p95", "max")),
+            )
+        console.print(table)
+    if data["counters"] or data["gauges"]:
+        table = Table(title="Counters")
+        table.add_column("metric")
+        table.add_column("value", justify="right")
+        for name, value in sorted({**data["counters"], **data["gauges"]}.items()):
+            table.add_row(name, f"{value:g}")
+        console.print(table)
+
+
+def dump(path: str) -> None:
+    """Writes the recorded metrics to a JSON file."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as metrics_file:
+        json.dump(summary(), metrics_file, indent=4)
+
+
+def reset() -> None:
+    """Forgets every recorded metric, e.g. before starting the next video."""
+    _samples.clear()
+    _counters.clear()
+    _gauges.clear()
+    _units.clear()
@@ -1,5 +1,196 @@
+import json
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from utils import metrics
+
+SESSION_DIR = "assets/browser"
+SESSION_COOKIE = "reddit_session"
+
+
 def clear_cookie_by_name(context, cookie_cleared_name):
     cookies = context.cookies()
     filtered_cookies = [cookie for cookie in cookies if cookie["name"] != cookie_cleared_name]
     context.clear_cookies()
     context.add_cookies(filtered_cookies)
+
+
+def session_state_path(username: str) -> str:
+    """Returns the path the browser storage state of the given reddit account is persisted to."""
+    return f"{SESSION_DIR}/reddit-{username.casefold()}.json"
+
+
+def load_session_state(username: str) -> Optional[str]:
+    """Checks the persisted storage state of a reddit account without opening a browser.
+
+    Args:
+        username (str): The reddit account the session belongs to
+
+    Returns:
+        Optional[str]: Path to the storage state if it holds an unexpired reddit session, else None
+    """
+    path = session_state_path(username)
+    try:
+        with open(path, encoding="utf-8") as state_file:
+            state = json.load(state_file)
+    except (OSError, ValueError):
+        return None
+
+    # keep a minute of margin so the session doesn't expire halfway through the screenshots
+    deadline = time.time() + 60
+    for cookie in state.get("cookies", []):
+        if cookie.get("name") != SESSION_COOKIE:
+            continue
+        expires = cookie.get("expires", -1)
+        if expires == -1 or expires > deadline:
+            return path
+    return None
+
+
+def is_logged_in(context, username: str) -> bool:
+    """Asks reddit which account the context is authenticated as. Much cheaper than loading a page.
+
+    Args:
+        context (BrowserContext): The browser context holding the session cookies
+        username (str): The account that is expected to be logged in
+
+    Returns:
+        bool: Whether the context is logged in as the given account
+    """
+    try:
+        response = context.request.get("https://www.reddit.com/api/me.json")
+        if not response.ok:
+            return False
+        data = response.json()
+    except Exception:
+        return False
+    if not isinstance(data, dict):
+        return False
+    name = data.get("data", data).get("name", "")
+    return str(name).casefold() == username.casefold()
+
+
+def save_session_state(context, username: str) -> None:
+    """Persists the storage state of an authenticated context so later runs can skip the login.
+
+    The file is written next to its destination first and then moved into place, so parallel
+    workers never read a half written session.
+    """
+    path = session_state_path(username)
+    Path(SESSION_DIR).mkdir(parents=True, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    context.storage_state(path=temp_path)
+    os.replace(temp_path, path)
+
+
+def discard_session_state(username: str) -> None:
+    """Deletes the persisted storage state of a reddit account, forcing a new login."""
+    try:
+        os.remove(session_state_path(username))
+    except FileNotFoundError:
+        pass
+
+
+def _matches_domain(host: str, domains) -> bool:
+    return any(host == domain or host.endswith(f".{domain}") for domain in domains)
+
+
+class RequestFilter:
+    """Blocks requests that never show up in screenshots (media, ads, analytics and optionally
+    fonts) and can keep track of what each page loaded and what was blocked.
+
+    Chromium blocks the requests itself (Network.setBlockedURLs). Routing them through Playwright
+    would turn off the HTTP cache, so every comment page would download reddit's scripts and
+    styles again.
+
+    Args:
+        block_fonts (bool): Whether web fonts are blocked as well
+        allowlist (list): Extra domains that are never blocked for being on the domain list
+        collect_stats (bool): Whether the loaded bytes and blocked requests of every page are
+            counted for report_page
+    """
+
+    def __init__(self, block_fonts: bool = False, allowlist: list = None, collect_stats=False):
+        with open("./utils/request_filters.json", encoding="utf-8") as json_file:
+            filters = json.load(json_file)
+        resource_types = list(filters["resource_types"])
+        if block_fonts:
+            resource_types += filters["font_resource_types"]
+        self.allowlist = filters["allowlist"] + (allowlist or [])
+        self.domains = [
+            domain for domain in filters["domains"] if not _matches_domain(domain, self.allowlist)
+        ]
+        self.url_patterns = [
+            pattern
+            for resource_type in resource_types
+            for pattern in filters["url_patterns"][resource_type]
+        ]
+        for domain in self.domains:
+            self.url_patterns += [f"*://{domain}/*", f"*://*.{domain}/*"]
+        self.collect_stats = collect_stats
+        self.blocked: Dict[str, int] = defaultdict(int)
+        self.loaded_requests = 0
+        self.loaded_bytes = 0
+        self._requests: Dict[str, tuple] = {}
+        self._sessions = []
+
+    def attach(self, page) -> None:
+        """Starts filtering the requests of a page, call it before the page navigates."""
+        cdp = page.context.new_cdp_session(page)
+        cdp.send("Network.enable")
+        cdp.send("Network.setBlockedURLs", {"urls": self.url_patterns})
+        if self.collect_stats:
+            cdp.on("Network.requestWillBeSent", self._sent)
+            cdp.on("Network.loadingFinished", self._finished)
+            cdp.on("Network.loadingFailed", self._failed)
+        self._sessions.append(cdp)  # blocking ends when the session goes away
+
+    def block_reason(self, url: str, resource_type: str) -> Optional[str]:
+        """Returns why a blocked request was blocked."""
+        host = urlparse(url).hostname or ""
+        if _matches_domain(host, self.domains):
+            return "domain"
+        return resource_type.lower()
+
+    def _sent(self, event: dict) -> None:
+        self._requests[event["requestId"]] = (event["request"]["url"], event.get("type", ""))
+
+    def _finished(self, event: dict) -> None:
+        self._requests.pop(event["requestId"], None)
+        self.loaded_requests += 1
+        self.loaded_bytes += int(event.get("encodedDataLength", 0))
+
+    def _failed(self, event: dict) -> None:
+        url, resource_type = self._requests.pop(event["requestId"], ("", ""))
+        if event.get("blockedReason") == "inspector":  # blocked by setBlockedURLs
+            self.blocked[self.block_reason(url, resource_type or event.get("type", ""))] += 1
+
+    def report_page(self, page_name: str) -> dict:
+        """Records the requests of the page that was just screenshotted and starts counting anew.
+
+        Blocked requests are never sent, so their size is unknown and only their number is kept.
+        What they would have cost shows up as fewer loaded bytes per page. Without collect_stats
+        everything is 0.
+        """
+        report = {
+            "page": page_name,
+            "blocked_requests": sum(self.blocked.values()),
+            "blocked_by": dict(self.blocked),
+            "loaded_requests": self.loaded_requests,
+            "loaded_bytes": self.loaded_bytes,
+        }
+        if not self.collect_stats:
+            return report
+        metrics.observe("screenshot.page.loaded_bytes", self.loaded_bytes, unit="B")
+        metrics.observe("screenshot.page.blocked_requests", report["blocked_requests"], unit="")
+        metrics.increment("screenshot.requests.loaded", self.loaded_requests)
+        for reason, count in self.blocked.items():
+            metrics.increment(f"screenshot.requests.blocked.{reason}", count)
+        self.blocked.clear()
+        self.loaded_requests = 0
+        self.loaded_bytes = 0
+        return report
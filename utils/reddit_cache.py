@@ -0,0 +1,142 @@
+import json
+import os
+import sqlite3
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, List
+
+from utils import metrics, settings
+
+CACHE_PATH = "assets/cache/reddit.sqlite"
+
+# The attributes of a praw Submission the bot reads
+SUBMISSION_FIELDS = (
+    "id",
+    "title",
+    "selftext",
+    "is_self",
+    "over_18",
+    "stickied",
+    "num_comments",
+    "score",
+    "upvote_ratio",
+    "permalink",
+    "edited",
+)
+
+
+class CachedSubmission(SimpleNamespace):
+    """A submission read back from the cache. It has the attributes of a praw Submission the bot
+    uses, but no comments; those are cached on their own (see reddit.subreddit).
+    """
+
+    def __str__(self) -> str:
+        return self.id  # like a praw Submission, see utils.videos.check_done
+
+
+def snapshot_submission(submission) -> dict:
+    """Returns the data of a praw Submission that is stored in the cache."""
+    data = {field: getattr(submission, field) for field in SUBMISSION_FIELDS}
+    data["author"] = submission.author.name if submission.author else None
+    data["subreddit"] = submission.subreddit.display_name
+    return data
+
+
+def load_submission(data: dict) -> CachedSubmission:
+    """Turns the output of snapshot_submission back into a submission like object."""
+    return CachedSubmission(
+        **{
+            **data,
+            "author": SimpleNamespace(name=data["author"]) if data["author"] else None,
+            "subreddit": SimpleNamespace(display_name=data["subreddit"]),
+        }
+    )
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    connection = sqlite3.connect(CACHE_PATH, timeout=30)
+    # lets several workers read while one of them writes
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS entries ("
+        "kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, fetched REAL NOT NULL, "
+        "PRIMARY KEY (kind, key))"
+    )
+    return connection
+
+
+def cached(kind: str, key: str, fetch: Callable[[], Any]) -> Any:
+    """Returns a cached reddit answer, or fetches and stores it when it is missing or older than
+    reddit_cache_ttl minutes.
+
+    With reddit_replay on, everything is served from the cache no matter how old it is and
+    nothing is fetched, so a recorded run can be repeated without network access.
+
+    Args:
+        kind (str): What is cached, e.g. "listing", "submission" or "comments"
+        key (str): What identifies it within its kind
+        fetch (Callable[[], Any]): Gets the answer from reddit, it has to be JSON serializable
+
+    Raises:
+        LookupError: When replaying and the answer was never recorded
+
+    Returns:
+        Any: The answer
+    """
+    thread_config = settings.config["reddit"]["thread"]
+    replay = thread_config["reddit_replay"]
+    ttl = float(thread_config["reddit_cache_ttl"] or 0) * 60
+    if not replay and ttl <= 0:
+        return fetch()
+
+    connection = _connect()
+    try:
+        row = connection.execute(
+            "SELECT value, fetched FROM entries WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone()
+        if row and (replay or time.time() - row[1] < ttl):
+            metrics.increment("reddit_cache.hits")
+            return json.loads(row[0])
+        if replay:
+            raise LookupError(
+                f"The {kind} {key} wasn't recorded. Run once with reddit_replay off to record it."
+            )
+        metrics.increment("reddit_cache.misses")
+        value = fetch()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (kind, key, value, fetched) VALUES (?, ?, ?, ?)",
+                (kind, key, json.dumps(value), time.time()),
+            )
+        return value
+    finally:
+        connection.close()
+
+
+def cache_key(*parts) -> str:
+    """Joins everything that changes an answer into one key."""
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+def get_listing(subreddit, sort: str, limit: int, **params) -> List[CachedSubmission]:
+    """Returns a listing of a subreddit through the cache.
+
+    Args:
+        subreddit: The praw Subreddit, or only its name when replaying
+        sort (str): The listing, e.g. "hot" or "top"
+        limit (int): How many submissions to list
+        params: Further arguments of the listing, like time_filter
+
+    Returns:
+        List[CachedSubmission]: The submissions in listing order
+    """
+    data = cached(
+        "listing",
+        cache_key(str(subreddit), sort, limit, params),
+        lambda: [
+            snapshot_submission(submission)
+            for submission in getattr(subreddit, sort)(limit=limit, **params)
+        ],
+    )
+    return [load_submission(submission) for submission in data]
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from utils import asset_store, metrics
+
+CACHE_DIR = "assets/cache/screenshots"
+
+
+class ScreenshotCache:
+    """Persistent cache of rendered post and comment images with least recently used eviction.
+
+    A file's modification time doubles as its last use, so the cache needs no index and can be
+    shared by several workers.
+
+    Args:
+        max_size (int): Size cap of the cache in megabytes
+        directory (str): Where the cached images are stored
+    """
+
+    def __init__(self, max_size: int, directory: str = CACHE_DIR):
+        self.max_bytes = max_size * 1024 * 1024
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(item_id: str, edited, **render_params) -> str:
+        """Builds the cache key of a post or comment image.
+
+        Args:
+            item_id (str): The id of the post or comment
+            edited: When the post or comment was last edited (praw's edited attribute)
+            render_params: Everything else that changes the image (theme, zoom, resolution...)
+
+        Returns:
+            str: The cache key
+        """
+        identity = json.dumps([item_id, edited, render_params], sort_keys=True, default=str)
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.png"
+
+    def get(self, key: str, destination: str) -> bool:
+        """Links the cached image to destination.
+
+        Returns:
+            bool: Whether the image was cached
+        """
+        cached = self._path(key)
+        try:
+            asset_store.link_file(str(cached), destination)
+            os.utime(cached)  # mark as recently used
+        except FileNotFoundError:
+            metrics.increment("screenshot_cache.misses")
+            return False
+        metrics.increment("screenshot_cache.hits")
+        return True
+
+    def put(self, key: str, source: str) -> None:
+        """Stores a freshly rendered image and evicts the least recently used ones if needed.
+
+        Images are kept in the asset store, so identical ones (e.g. of removed comments) are
+        only stored once.
+        """
+        digest = asset_store.put(source)
+        if not (digest and asset_store.link(digest, str(self._path(key)), ".png")):
+            # the store can't link here, so the cache keeps its own copy
+            asset_store.link_file(source, str(self._path(key)))
+        self.evict()
+
+    def evict(self) -> None:
+        """Deletes the least recently used images until the cache fits its size cap."""
+        entries = []
+        for path in self.directory.glob("*.png"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # evicted by another worker
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            metrics.increment("screenshot_cache.evictions")
+        metrics.gauge("screenshot_cache.bytes", total)
@@ -1,16 +1,43 @@
 import json
+import os
 import random
 import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from random import randrange
 from typing import Any, Tuple, Dict
 
-from moviepy.editor import VideoFileClip, AudioFileClip
-from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
-from utils import settings
+import ffmpeg
+from utils import asset_store, settings
+from utils.background_index import (
+    checksum_matches,
+    get_background_info,
+    is_verified,
+    move_background,
+    snap_to_keyframe,
+    verify_background,
+)
 from utils.console import print_step, print_substep
+from utils.encoding import PROFILES
+from utils.ffmpeg_progress import CliProgress
+from video_creation.final_video import run_ffmpeg
 import yt_dlp
 
+# Backgrounds transcoded to the size and frame rate of the videos, see prepare_background_video
+PREPARED_DIR = "assets/backgrounds/prepared"
+# Downloads stay here until they are complete and verified
+DOWNLOAD_DIR = "assets/backgrounds/.download"
+
+YDL_OPTIONS = {
+    "video": {"format": "bestvideo[height<=1080][ext=mp4]"},
+    "audio": {"format": "bestaudio/best", "extract_audio": True},
+}
+
+_download_locks = defaultdict(threading.Lock)
+_download_locks_lock = threading.Lock()
+
 
 def load_background_options():
     background_options = {}
@@ -56,6 +83,17 @@ def get_start_and_end_times(video_length: int, length_of_clip: int) -> Tuple[int
     return random_time, random_time + video_length
 
 
+def background_path(mode: str, background_config: Tuple) -> str:
+    """Returns where a background video or audio is stored once downloaded."""
+    # note: make sure the file name doesn't include an - in it
+    return f"assets/backgrounds/{mode}/{background_config[2]}-{background_config[1]}"
+
+
+def is_background_ready(mode: str, background_config: Tuple) -> bool:
+    """Whether a background is downloaded and verified, so using it won't block on a download."""
+    return is_verified(background_path(mode, background_config))
+
+
 def get_background_config(mode: str):
     """Fetch the background/s configuration"""
     try:
@@ -65,62 +103,216 @@ def get_background_config(mode: str):
         choice = None
 
     # Handle default / not supported background using default option.
-    # Default : pick random from supported background.
+    # Default : pick random from supported background, preferring those that are downloaded.
     if not choice or choice not in background_options[mode]:
-        choice = random.choice(list(background_options[mode].keys()))
+        ready = [
+            name
+            for name, background_config in background_options[mode].items()
+            if is_background_ready(mode, background_config)
+        ]
+        choice = random.choice(ready or list(background_options[mode].keys()))
 
     return background_options[mode][choice]
 
 
+def fetch_background(mode: str, background_config: Tuple, quiet: bool = False) -> str:
+    """Downloads a background unless it is already there, resuming an interrupted download.
+
+    The download goes to assets/backgrounds/.download first and is only moved into place once
+    ffprobe could read it and its checksum is recorded, so a partial file is never used.
+    Backgrounds downloaded before verification existed are verified on first use and downloaded
+    again when they are broken.
+
+    Args:
+        mode (str): "video" or "audio"
+        background_config (Tuple): The entry of the background in utils/background_{mode}s.json
+        quiet (bool): Hide the yt-dlp output, for downloads running next to a render
+
+    Raises:
+        ValueError: When the downloaded file is broken. It is deleted, so the next try starts over.
+
+    Returns:
+        str: Path of the background
+    """
+    path = background_path(mode, background_config)
+    with _download_locks_lock:
+        download_lock = _download_locks[path]
+    with download_lock:
+        uri = background_config[0]
+        staging_path = f"{DOWNLOAD_DIR}/{mode}/{Path(path).name}"
+        Path(staging_path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        if Path(path).is_file():
+            if is_verified(path):
+                return path
+            try:
+                verify_background(path)
+                return path
+            except (ffmpeg.Error, ValueError, KeyError, StopIteration):
+                print_substep(f"{path} is broken, downloading it again", style="yellow")
+                # most likely cut off by an interrupted download from before the staging folder,
+                # so it becomes the partial download yt-dlp resumes. A file linked to the store
+                # is dropped instead, appending to it would change the blob.
+                asset_store.detach(path)
+                if Path(path).is_file():
+                    os.replace(path, f"{staging_path}.part")
+
+        ydl_opts = {
+            **YDL_OPTIONS[mode],
+            "outtmpl": staging_path,
+            "retries": 10,
+            "continuedl": True,  # picks up the .part file of an interrupted download
+            "quiet": quiet,
+            "noprogress": quiet,
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            ydl.download([uri])
+        try:
+            entry = verify_background(staging_path)
+        except (ffmpeg.Error, ValueError, KeyError, StopIteration) as error:
+            os.remove(staging_path)
+            raise ValueError(f"The download of {uri} is broken, try again") from error
+        # the same source added under another name ends up as a link to the same blob
+        asset_store.put(staging_path, entry["sha256"])
+        move_background(staging_path, path)
+    return path
+
+
 def download_background_video(background_config: Tuple[str, str, str, Any]):
     """Downloads the background/s video from YouTube."""
-    Path("./assets/backgrounds/video/").mkdir(parents=True, exist_ok=True)
-    # note: make sure the file name doesn't include an - in it
-    uri, filename, credit, _ = background_config
-    if Path(f"assets/backgrounds/video/{credit}-{filename}").is_file():
+    if is_background_ready("video", background_config):
         return
-    print_step(
-        "We need to download the backgrounds videos. they are fairly large but it's only done once. 😎"
-    )
-    print_substep("Downloading the backgrounds videos... please be patient 🙏 ")
-    print_substep(f"Downloading {filename} from {uri}")
-    ydl_opts = {
-        "format": "bestvideo[height<=1080][ext=mp4]",
-        "outtmpl": f"assets/backgrounds/video/{credit}-{filename}",
-        "retries": 10,
-    }
-
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download(uri)
+    uri, filename, credit, _ = background_config
+    if not Path(background_path("video", background_config)).is_file():
+        print_step(
+            "We need to download the backgrounds videos. they are fairly large but it's only done once. 😎"
+        )
+        print_substep("Downloading the backgrounds videos... please be patient 🙏 ")
+        print_substep(f"Downloading {filename} from {uri}")
+    fetch_background("video", background_config)
     print_substep("Background video downloaded successfully! 🎉", style="bold green")
 
 
 def download_background_audio(background_config: Tuple[str, str, str]):
     """Downloads the background/s audio from YouTube."""
-    Path("./assets/backgrounds/audio/").mkdir(parents=True, exist_ok=True)
-    # note: make sure the file name doesn't include an - in it
-    uri, filename, credit = background_config
-    if Path(f"assets/backgrounds/audio/{credit}-{filename}").is_file():
+    if is_background_ready("audio", background_config):
         return
-    print_step(
-        "We need to download the backgrounds audio. they are fairly large but it's only done once. 😎"
+    uri, filename, credit = background_config
+    if not Path(background_path("audio", background_config)).is_file():
+        print_step(
+            "We need to download the backgrounds audio. they are fairly large but it's only done once. 😎"
+        )
+        print_substep("Downloading the backgrounds audio... please be patient 🙏 ")
+        print_substep(f"Downloading {filename} from {uri}")
+    fetch_background("audio", background_config)
+    print_substep("Background audio downloaded successfully! 🎉", style="bold green")
+
+
+def prefetch_backgrounds(workers: int = 4, verify: bool = False, quiet: bool = True) -> Dict:
+    """Downloads every background in utils/background_videos.json and background_audios.json
+    side by side, so videos never wait for a first time download.
+
+    Args:
+        workers (int): How many backgrounds are downloaded at the same time
+        verify (bool): Also read the backgrounds that are already there again and download the
+            ones whose checksum changed
+        quiet (bool): Hide the yt-dlp output
+
+    Returns:
+        Dict: How many backgrounds were ready, downloaded and failed
+    """
+    results = {"ready": 0, "downloaded": 0, "failed": 0}
+    lock = threading.Lock()
+
+    def prefetch(mode: str, background_config: Tuple) -> None:
+        path = background_path(mode, background_config)
+        outcome = "ready"
+        try:
+            if verify and is_verified(path) and not checksum_matches(path):
+                print_substep(f"{path} is corrupted, downloading it again", style="yellow")
+                os.remove(path)
+            if not is_background_ready(mode, background_config):
+                outcome = "downloaded"
+                fetch_background(mode, background_config, quiet=quiet)
+        except Exception as error:  # one broken download shouldn't stop the others
+            outcome = "failed"
+            print_substep(f"Could not prefetch {path}: {error}", style="red")
+        with lock:
+            results[outcome] += 1
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for mode in ("video", "audio"):
+            for background_config in background_options[mode].values():
+                executor.submit(prefetch, mode, background_config)
+    return results
+
+
+def start_background_prefetch(workers: int = 2) -> threading.Thread:
+    """Prefetches the backgrounds in a background thread while videos are being made."""
+    thread = threading.Thread(
+        target=prefetch_backgrounds, kwargs={"workers": workers}, name="BackgroundPrefetch"
     )
-    print_substep("Downloading the backgrounds audio... please be patient 🙏 ")
-    print_substep(f"Downloading {filename} from {uri}")
-    ydl_opts = {
-        "outtmpl": f"./assets/backgrounds/audio/{credit}-{filename}",
-        "format": "bestaudio/best",
-        "extract_audio": True,
-    }
+    thread.daemon = True  # an unfinished download is resumed on the next run
+    thread.start()
+    return thread
 
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([uri])
 
-    print_substep("Background audio downloaded successfully! 🎉", style="bold green")
+def prepare_background_video(video_choice: str, reddit_id: str) -> str:
+    """Transcodes a downloaded background once into a render ready copy: cropped to the aspect
+    ratio of the videos, scaled to their resolution, at their frame rate and with a keyframe every
+    second, so cutting a window is a stream copy that starts close to where it was asked to and
+    the final render doesn't have to scale it any more.
+
+    Args:
+        video_choice (str): The file name of the background in assets/backgrounds/video
+        reddit_id (str): The ID of the reddit post being made
+
+    Returns:
+        str: Path of the prepared background
+    """
+    W = int(settings.config["settings"]["resolution_w"])
+    H = int(settings.config["settings"]["resolution_h"])
+    source = f"assets/backgrounds/video/{video_choice}"
+    source_info = get_background_info(source)
+    profile = PROFILES.get(settings.config["settings"]["encoding"]["encoding_profile"], {})
+    fps = profile.get("fps") or source_info["fps"] or 30
+
+    path = f"{PREPARED_DIR}/{W}x{H}-{fps:g}fps/{video_choice}"
+    if Path(path).is_file():
+        return path
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    print_step("Preparing the background video for this resolution, this is only done once...")
+    temp_path = f"{path}.{os.getpid()}.tmp.mp4"
+    run_ffmpeg(
+        ffmpeg.input(source)["v"]
+        .filter("crop", f"ih*({W}/{H})", "ih")
+        .filter("scale", W, H)
+        .filter("fps", fps)
+        .output(
+            temp_path,
+            an=None,
+            movflags="+faststart",
+            **{
+                "c:v": "libx264",
+                "preset": "veryfast",
+                "crf": 16,
+                "g": round(fps),
+                "pix_fmt": "yuv420p",
+            },
+        )
+        .overwrite_output(),
+        reddit_id,
+        "background",
+        source_info["duration"],
+        [CliProgress()],
+    )
+    # moved into place once complete, so an interrupted transcode is never picked up
+    os.replace(temp_path, path)
+    return path
 
 
 def chop_background(background_config: Dict[str, Tuple], video_length: int, reddit_object: dict):
-    """Generates the background audio and footage to be used in the video and writes it to assets/temp/background.mp3 and assets/temp/background.mp4
+    """Generates the background audio and footage to be used in the video and writes it to assets/temp/background.mka and assets/temp/background.mp4
 
     Args:
         background_config (Dict[str,Tuple]]) : Current background configuration
@@ -133,32 +325,67 @@ def chop_background(background_config: Dict[str, Tuple], video_length: int, redd
     else:
         print_step("Finding a spot in the backgrounds audio to chop...✂️")
         audio_choice = f"{background_config['audio'][2]}-{background_config['audio'][1]}"
-        background_audio = AudioFileClip(f"assets/backgrounds/audio/{audio_choice}")
+        audio_info = get_background_info(f"assets/backgrounds/audio/{audio_choice}")
         start_time_audio, end_time_audio = get_start_and_end_times(
-            video_length, background_audio.duration
+            video_length, audio_info["duration"]
+        )
+        # Copied instead of re-encoded, so it takes the same few milliseconds for any length.
+        # Matroska holds whatever codec the download came in.
+        (
+            ffmpeg.input(
+                f"assets/backgrounds/audio/{audio_choice}",
+                ss=start_time_audio,
+                t=end_time_audio - start_time_audio,
+            )
+            .output(f"assets/temp/{id}/background.mka", vn=None, **{"c:a": "copy"})
+            .overwrite_output()
+            .run(quiet=True)
         )
-        background_audio = background_audio.subclip(start_time_audio, end_time_audio)
-        background_audio.write_audiofile(f"assets/temp/{id}/background.mp3")
 
     print_step("Finding a spot in the backgrounds video to chop...✂️")
     video_choice = f"{background_config['video'][2]}-{background_config['video'][1]}"
-    background_video = VideoFileClip(f"assets/backgrounds/video/{video_choice}")
-    start_time_video, end_time_video = get_start_and_end_times(
-        video_length, background_video.duration
-    )
+    video_path = f"assets/backgrounds/video/{video_choice}"
+    if settings.config["settings"]["background"]["background_prepare"]:
+        video_path = prepare_background_video(video_choice, id)
+    video_info = get_background_info(video_path)
+    start_time_video, end_time_video = get_start_and_end_times(video_length, video_info["duration"])
+    # Starting on a keyframe makes the stream copy begin exactly where it was asked to
+    start_time_video = snap_to_keyframe(video_info, start_time_video)
+    end_time_video = start_time_video + video_length
     # Extract video subclip
     try:
-        ffmpeg_extract_subclip(
-            f"assets/backgrounds/video/{video_choice}",
-            start_time_video,
-            end_time_video,
-            targetname=f"assets/temp/{id}/background.mp4",
+        (
+            ffmpeg.input(
+                video_path,
+                ss=start_time_video,
+                t=end_time_video - start_time_video,
+            )
+            .output(
+                f"assets/temp/{id}/background.mp4",
+                an=None,
+                avoid_negative_ts="make_zero",
+                **{"c:v": "copy"},
+            )
+            .overwrite_output()
+            .run(quiet=True)
         )
-    except (OSError, IOError):  # ffmpeg issue see #348
+    except ffmpeg.Error:  # ffmpeg issue see #348
         print_substep("FFMPEG issue. Trying again...")
-        with VideoFileClip(f"assets/backgrounds/video/{video_choice}") as video:
-            new = video.subclip(start_time_video, end_time_video)
-            new.write_videofile(f"assets/temp/{id}/background.mp4")
+        # Re-encode losslessly with the fastest preset, the final render encodes it anyway
+        (
+            ffmpeg.input(
+                video_path,
+                ss=start_time_video,
+                t=end_time_video - start_time_video,
+            )
+            .output(
+                f"assets/temp/{id}/background.mp4",
+                an=None,
+                **{"c:v": "libx264", "preset": "ultrafast", "qp": 0},
+            )
+            .overwrite_output()
+            .run(quiet=True)
+        )
     print_substep("Background video chopped successfully!", style="bold green")
     return background_config["video"][2]
 
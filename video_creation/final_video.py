@@ -1,68 +1,53 @@
 import multiprocessing
 import os
 import re
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from os.path import exists  # Needs to be imported specifically
+from pathlib import Path
 from typing import Final
-from typing import Tuple, Any, Dict
+from typing import Tuple, Any, Callable, Dict, List, Sequence
 
 import ffmpeg
 import translators
-from PIL import Image
+from PIL import Image, ImageDraw, ImageFont
 from rich.console import Console
 from rich.progress import track
 
 from utils.cleanup import cleanup
 from utils.console import print_step, print_substep
+from utils.encoding import PROFILES, output_args, parse_renditions, pick_profile
+from utils.ffmpeg_progress import (
+    CliProgress,
+    clear_gui_progress,
+    read_progress,
+    record_metrics,
+    write_gui_progress,
+)
 from utils.thumbnail import create_thumbnail
 from utils.videos import save_data
 from utils import settings
 
-import tempfile
-import threading
-import time
-
 console = Console()
 
+# Longer filter graphs are passed to ffmpeg as a file instead of on the command line
+MAX_FILTER_LENGTH = 8000
+# The cards and the credit used to be laid on the (at most 1080p) background before the whole
+# frame was scaled to the video size. Their sizes are still relative to that, so they look the
+# same no matter the resolution of the background or whether it was prepared.
+SOURCE_HEIGHT = 1080
 
-class ProgressFfmpeg(threading.Thread):
-    def __init__(self, vid_duration_seconds, progress_update_callback):
-        threading.Thread.__init__(self, name="ProgressFfmpeg")
-        self.stop_event = threading.Event()
-        self.output_file = tempfile.NamedTemporaryFile(mode="w+", delete=False)
-        self.vid_duration_seconds = vid_duration_seconds
-        self.progress_update_callback = progress_update_callback
-
-    def run(self):
-        while not self.stop_event.is_set():
-            latest_progress = self.get_latest_ms_progress()
-            if latest_progress is not None:
-                completed_percent = latest_progress / self.vid_duration_seconds
-                self.progress_update_callback(completed_percent)
-            time.sleep(1)
-
-    def get_latest_ms_progress(self):
-        lines = self.output_file.readlines()
-
-        if lines:
-            for line in lines:
-                if "out_time_ms" in line:
-                    out_time_ms_str = line.split("=")[1].strip()
-                    if out_time_ms_str.isnumeric():
-                        return float(out_time_ms_str) / 1000000.0
-                    else:
-                        # Handle the case when "N/A" is encountered
-                        return None
-        return None
-
-    def stop(self):
-        self.stop_event.set()
 
-    def __enter__(self):
-        self.start()
-        return self
-
-    def __exit__(self, *args, **kwargs):
-        self.stop()
+def card_width(W: int, H: int) -> int:
+    """Returns how wide the title and comment cards are in the video: 45% of the width of the
+    background cropped from a 1080p source, scaled to the video size.
+    Args:
+        W (int): The width of the video
+        H (int): The height of the video
+    """
+    width = int((W * 45) // 100 * H / SOURCE_HEIGHT)
+    return min(W, width - width % 2)
 
 
 def name_normalize(name: str) -> str:
@@ -82,33 +67,325 @@ def name_normalize(name: str) -> str:
         return name
 
 
-def prepare_background(reddit_id: str, W: int, H: int) -> str:
-    output_path = f"assets/temp/{reddit_id}/background_noaudio.mp4"
-    output = (
-        ffmpeg.input(f"assets/temp/{reddit_id}/background.mp4")
-        .filter("crop", f"ih*({W}/{H})", "ih")
-        .output(
-            output_path,
-            an=None,
-            **{
-                "c:v": "h264",
-                "b:v": "20M",
-                "b:a": "192k",
-                "threads": multiprocessing.cpu_count(),
-            },
-        )
-        .overwrite_output()
+def prepare_background(reddit_id: str, W: int, H: int, start: float = 0, duration: float = None):
+    """Crops the chopped background to the aspect ratio of the video as part of the final render,
+    so the background is decoded once and encoded once.
+    Args:
+        reddit_id (str): The ID of the reddit post
+        W (int): The width of the video
+        H (int): The height of the video
+        start (float): Where the part of the background to use starts, in seconds
+        duration (float): How long the part of the background is, None for the rest of it
+    """
+    input_args = {"ss": start} if start else {}
+    if duration is not None:
+        input_args["t"] = duration
+    return ffmpeg.input(f"assets/temp/{reddit_id}/background.mp4", **input_args)["v"].filter(
+        "crop", f"ih*({W}/{H})", "ih"
     )
-    try:
-        output.run(quiet=True)
-    except ffmpeg.Error as e:
-        print(e.stderr.decode("utf8"))
-        exit(1)
+
+
+def fit_overlay(path: str, width: int, opacity: float = 1) -> Image.Image:
+    """Bakes the scaling and opacity into an overlay image and crops away its transparent border,
+    so ffmpeg only has to composite it instead of filtering it on every frame.
+    The crop is symmetric, which keeps the centered overlay in the same place.
+    Args:
+        path (str): The png to overlay
+        width (int): The width of the overlay in the video
+        opacity (float): The opacity of the overlay
+    Returns:
+        Image.Image: The prepared overlay
+    """
+    with Image.open(path) as image:
+        image = image.convert("RGBA")
+    if image.width != width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.LANCZOS)
+    if opacity < 1:
+        image.putalpha(image.getchannel("A").point(lambda alpha: round(alpha * opacity)))
+    bbox = image.getchannel("A").getbbox()
+    if bbox:
+        left, top, right, bottom = bbox
+        dx = min(left, image.width - right)
+        dy = min(top, image.height - bottom)
+        image = image.crop((dx, dy, image.width - dx, image.height - dy))
+    return image
+
+
+def prepare_overlay_timeline(
+    overlays: List[Tuple[str, float]], reddit_id: str, width: int, opacity: float = 1
+) -> str:
+    """Turns the overlays into a single image sequence, so the video needs one overlay filter
+    instead of one per image, no matter how many comments it shows.
+    Every image is centered on a canvas as large as the largest one, because the overlay filter
+    can't change size halfway through, and a blank image hides the overlay between and after them.
+    Args:
+        overlays (List[Tuple[str, float]]): The pngs to overlay and how many seconds each is shown
+        reddit_id (str): The ID of the reddit post
+        width (int): The width of the overlays in the video
+        opacity (float): The opacity of the overlays
+    Returns:
+        str: Path of the ffconcat list describing the whole sequence
+    """
+    overlay_dir = Path(f"assets/temp/{reddit_id}/overlays")
+    overlay_dir.mkdir(parents=True, exist_ok=True)
+    images = [
+        fit_overlay(path, width, opacity)
+        for path, _ in track(overlays, "Preparing the image files...")
+    ]
+    # even dimensions, so the canvas maps cleanly onto subsampled chroma
+    canvas_width = max(image.width for image in images)
+    canvas_width += canvas_width % 2
+    canvas_height = max(image.height for image in images)
+    canvas_height += canvas_height % 2
+
+    for (path, _), image in zip(overlays, images):
+        canvas = Image.new("RGBA", (canvas_width, canvas_height), (0, 0, 0, 0))
+        canvas.paste(image, ((canvas_width - image.width) // 2, (canvas_height - image.height) // 2))
+        canvas.save(overlay_dir / Path(path).name, compress_level=1)  # read once by ffmpeg
+    Image.new("RGBA", (canvas_width, canvas_height), (0, 0, 0, 0)).save(overlay_dir / "blank.png")
+    return write_overlay_timeline(overlays, reddit_id)
+
+
+def write_overlay_timeline(
+    overlays: List[Tuple[str, float]],
+    reddit_id: str,
+    start: float = 0,
+    end: float = None,
+    name: str = "timeline",
+) -> str:
+    """Writes the ffconcat list of the images prepared by prepare_overlay_timeline that are shown
+    between start and end, with timestamps relative to start.
+    Args:
+        overlays (List[Tuple[str, float]]): The pngs to overlay and how many seconds each is shown
+        reddit_id (str): The ID of the reddit post
+        start (float): Where the listed part of the timeline starts, in seconds
+        end (float): Where it ends, None for after the last image
+        name (str): The name of the list file
+    Returns:
+        str: Path of the ffconcat list
+    """
+    lines = ["ffconcat version 1.0"]
+    cursor = start
+    image_start = 0
+    for path, duration in overlays:
+        if end is not None and image_start >= end:
+            break
+        image_end = image_start + duration
+        if end is not None:
+            image_end = min(image_end, end)
+        # a microsecond of slack, so float sums don't add empty entries at the boundaries
+        if image_end - cursor > 1e-6:
+            if image_start - cursor > 1e-6:
+                lines += ["file 'blank.png'", f"duration {image_start - cursor:.6f}"]
+                cursor = image_start
+            lines += [f"file '{Path(path).name}'", f"duration {image_end - cursor:.6f}"]
+            cursor = image_end
+        image_start += duration
+    lines.append("file 'blank.png'")
+
+    output_path = Path(f"assets/temp/{reddit_id}/overlays/{name}.ffconcat")
+    output_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(output_path)
+
+
+def compose_video(
+    reddit_id: str,
+    W: int,
+    H: int,
+    timeline: str,
+    credit: str,
+    start: float = 0,
+    duration: float = None,
+):
+    """Builds the video graph: the background cropped and scaled to the video size, with the
+    overlay timeline and the credit on top.
+    Args:
+        reddit_id (str): The ID of the reddit post
+        W (int): The width of the video
+        H (int): The height of the video
+        timeline (str): The ffconcat list of the overlays, relative to start
+        credit (str): Path of the credit image
+        start (float): Where the part of the video to build starts, in seconds
+        duration (float): How long the part of the video is, None for the rest of it
+    """
+    video = prepare_background(reddit_id, W=W, H=H, start=start, duration=duration)
+    # a prepared background already has the video size, then scale passes it through
+    video = video.filter("scale", W, H)
+    video = video.overlay(
+        ffmpeg.input(timeline, f="concat"),
+        x="(main_w-overlay_w)/2",
+        y="(main_h-overlay_h)/2",
+        eof_action="pass",
+    )
+    return video.overlay(ffmpeg.input(credit), x="main_w-overlay_w", y="main_h-overlay_h")
+
+
+def fit_rendition(video, width: int, height: int):
+    """Crops the video to the aspect ratio of a rendition around its center and scales it to size.
+    Args:
+        video: The composed video stream
+        width (int): The width of the rendition
+        height (int): The height of the rendition
+    """
+    return video.filter(
+        "crop", f"min(iw,ih*{width}/{height})", f"min(ih,iw*{height}/{width})"
+    ).filter("scale", width, height)
+
+
+def plan_segments(
+    overlays: List[Tuple[str, float]], length: float, count: int, fps: float
+) -> List[Tuple[float, float]]:
+    """Splits the video into about count equally long parts that start where an image starts,
+    snapped to the frame grid so the encoded parts join without a dropped or repeated frame.
+    Args:
+        overlays (List[Tuple[str, float]]): The pngs to overlay and how many seconds each is shown
+        length (float): The length of the video in seconds
+        count (int): How many parts to aim for
+        fps (float): The frame rate of the encoded video
+    Returns:
+        List[Tuple[float, float]]: The start and end of every part in seconds
+    """
+    image_starts = []
+    position = 0
+    for _, duration in overlays[:-1]:
+        position += duration
+        image_starts.append(position)
+
+    boundaries = [0.0]
+    for part in range(1, count):
+        target = length * part / count
+        candidates = [start for start in image_starts if start > boundaries[-1]]
+        if not candidates:
+            break
+        boundary = round(min(candidates, key=lambda start: abs(start - target)) * fps) / fps
+        if 0 < boundary - boundaries[-1] and boundary < length:
+            boundaries.append(boundary)
+    boundaries.append(length)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def render_segments(
+    segments: List[Tuple[float, float]],
+    overlays: List[Tuple[str, float]],
+    reddit_id: str,
+    W: int,
+    H: int,
+    credit: str,
+    video_args: dict,
+) -> str:
+    """Encodes every part of the video in its own ffmpeg process, all at the same time.
+    Args:
+        segments (List[Tuple[float, float]]): The parts planned by plan_segments
+        overlays (List[Tuple[str, float]]): The pngs to overlay and how many seconds each is shown
+        reddit_id (str): The ID of the reddit post
+        W (int): The width of the video
+        H (int): The height of the video
+        credit (str): Path of the credit image
+        video_args (dict): The ffmpeg output options of the encoding profile
+    Returns:
+        str: Path of the ffconcat list joining the encoded parts in order
+    """
+    segment_dir = Path(f"assets/temp/{reddit_id}/segments")
+    segment_dir.mkdir(parents=True, exist_ok=True)
+    threads = max(1, multiprocessing.cpu_count() // len(segments))
+
+    def encode(index: int, start: float, end: float) -> None:
+        timeline = write_overlay_timeline(overlays, reddit_id, start, end, f"timeline_{index}")
+        # the last part runs to the end of the background, like the video does
+        duration = end - start if index < len(segments) - 1 else None
+        video = compose_video(reddit_id, W, H, timeline, credit, start, duration)
+        run_ffmpeg(
+            ffmpeg.output(
+                video, str(segment_dir / f"{index}.mp4"), **video_args, threads=threads
+            ).overwrite_output(),
+            reddit_id,
+            f"segment_{index}",
+            end - start,
+            [write_gui_progress, record_metrics],
+        )
+
+    with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+        futures = [
+            executor.submit(encode, index, start, end) for index, (start, end) in enumerate(segments)
+        ]
+        for future in track(as_completed(futures), "Encoding...", total=len(futures)):
+            future.result()
+
+    output_path = segment_dir / "segments.ffconcat"
+    lines = ["ffconcat version 1.0"] + [f"file '{index}.mp4'" for index in range(len(segments))]
+    output_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(output_path)
+
+
+def run_ffmpeg(
+    stream,
+    reddit_id: str,
+    render: str = "video",
+    duration: float = None,
+    listeners: Sequence[Callable[[dict], None]] = (),
+) -> None:
+    """Runs an ffmpeg graph like stream.run(quiet=True), but hands a long filter graph to ffmpeg
+    as a script file, since it would not fit on the command line (32767 characters on Windows).
+    When there are listeners, ffmpeg reports its progress through a pipe and every progress
+    event (see utils.ffmpeg_progress.read_progress) is passed to each of them as it arrives.
+    Args:
+        stream: The output stream to run
+        reddit_id (str): The ID of the reddit post, the script is written to its temp folder
+        render (str): The name of the render, so concurrent runs can be told apart
+        duration (float): Length in seconds of the output, for the percent and eta of the events
+        listeners (Sequence[Callable[[dict], None]]): Called with every progress event
+    Raises:
+        ffmpeg.Error: When ffmpeg fails
+    """
+    args = stream.compile()
+    if "-filter_complex" in args:
+        index = args.index("-filter_complex")
+        if len(args[index + 1]) > MAX_FILTER_LENGTH:
+            script_path = f"assets/temp/{reddit_id}/{render}.filter_complex.txt"
+            with open(script_path, "w", encoding="utf-8") as script:
+                script.write(args[index + 1])
+            args[index : index + 2] = ["-filter_complex_script", script_path]
+    if listeners:
+        args[1:1] = ["-progress", "pipe:1", "-nostats"]
+    # stderr goes to a file, so a chatty ffmpeg can't block on a full pipe nobody reads
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE if listeners else subprocess.DEVNULL,
+            stderr=stderr,
+        )
+        if listeners:
+            for event in read_progress(process.stdout, render, duration):
+                for listener in listeners:
+                    listener(event)
+        if process.wait() != 0:
+            stderr.seek(0)
+            raise ffmpeg.Error("ffmpeg", b"", stderr.read())
+
+
+def prepare_credit(text: str, reddit_id: str, font_size: int) -> str:
+    """Renders the background credit once, instead of drawing it with drawtext on every frame.
+    Args:
+        text (str): The credit
+        reddit_id (str): The ID of the reddit post
+        font_size (int): The font size in pixels of the final video
+    Returns:
+        str: Path of the credit image
+    """
+    font = ImageFont.truetype(os.path.join("fonts", "Roboto-Regular.ttf"), max(font_size, 1))
+    left, top, right, bottom = font.getbbox(text)
+    image = Image.new("RGBA", (max(right - left, 1), max(bottom - top, 1)), (0, 0, 0, 0))
+    ImageDraw.Draw(image).text((-left, -top), text, font=font, fill="white")
+    output_path = f"assets/temp/{reddit_id}/overlays/credit.png"
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    image.save(output_path)
     return output_path
 
 
 def merge_background_audio(audio: ffmpeg, reddit_id: str):
-    """Gather an audio and merge with assets/backgrounds/background.mp3
+    """Gather an audio and merge with assets/temp/{reddit_id}/background.mka
     Args:
         audio (ffmpeg): The TTS final audio but without background.
         reddit_id (str): The ID of subreddit
@@ -118,7 +395,7 @@ def merge_background_audio(audio: ffmpeg, reddit_id: str):
         return audio  # Return the original audio
     else:
         # sets volume to config
-        bg_audio = ffmpeg.input(f"assets/temp/{reddit_id}/background.mp3").filter(
+        bg_audio = ffmpeg.input(f"assets/temp/{reddit_id}/background.mka").filter(
             "volume",
             background_audio_volume,
         )
@@ -154,8 +431,7 @@ def make_final_video(
     )
 
     print_step("Creating the final video 🎥")
-
-    background_clip = ffmpeg.input(prepare_background(reddit_id, W=W, H=H))
+    clear_gui_progress()
 
     # Gather all audio clips
     audio_clips = list()
@@ -196,20 +472,12 @@ def make_final_video(
 
     console.log(f"[bold green] Video Will Be: {length} Seconds Long")
 
-    screenshot_width = int((W * 45) // 100)
+    screenshot_width = card_width(W, H)
     audio = ffmpeg.input(f"assets/temp/{reddit_id}/audio.mp3")
     final_audio = merge_background_audio(audio, reddit_id)
 
-    image_clips = list()
-
-    image_clips.insert(
-        0,
-        ffmpeg.input(f"assets/temp/{reddit_id}/png/title.png")["v"].filter(
-            "scale", screenshot_width, -1
-        ),
-    )
-
-    current_time = 0
+    # The images to show, with how long each is shown
+    overlays = list()
     if settings.config["settings"]["storymode"]:
         audio_clips_durations = [
             float(
@@ -221,49 +489,22 @@ def make_final_video(
             0,
             float(ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/title.mp3")["format"]["duration"]),
         )
-        if settings.config["settings"]["storymodemethod"] == 0:
-            image_clips.insert(
-                1,
-                ffmpeg.input(f"assets/temp/{reddit_id}/png/story_content.png").filter(
-                    "scale", screenshot_width, -1
-                ),
-            )
-            background_clip = background_clip.overlay(
-                image_clips[0],
-                enable=f"between(t,{current_time},{current_time + audio_clips_durations[0]})",
-                x="(main_w-overlay_w)/2",
-                y="(main_h-overlay_h)/2",
-            )
-            current_time += audio_clips_durations[0]
-        elif settings.config["settings"]["storymodemethod"] == 1:
-            for i in track(range(0, number_of_clips + 1), "Collecting the image files..."):
-                image_clips.append(
-                    ffmpeg.input(f"assets/temp/{reddit_id}/png/img{i}.png")["v"].filter(
-                        "scale", screenshot_width, -1
-                    )
-                )
-                background_clip = background_clip.overlay(
-                    image_clips[i],
-                    enable=f"between(t,{current_time},{current_time + audio_clips_durations[i]})",
-                    x="(main_w-overlay_w)/2",
-                    y="(main_h-overlay_h)/2",
-                )
-                current_time += audio_clips_durations[i]
+        overlays.append((f"assets/temp/{reddit_id}/png/title.png", audio_clips_durations[0]))
+        if settings.config["settings"]["storymodemethod"] == 1:
+            overlays += [
+                (f"assets/temp/{reddit_id}/png/img{i}.png", audio_clips_durations[i + 1])
+                for i in range(number_of_clips)
+            ]
+        # Story mode doesn't fade the images
+        opacity = 1
     else:
-        for i in range(0, number_of_clips + 1):
-            image_clips.append(
-                ffmpeg.input(f"assets/temp/{reddit_id}/png/comment_{i}.png")["v"].filter(
-                    "scale", screenshot_width, -1
-                )
-            )
-            image_overlay = image_clips[i].filter("colorchannelmixer", aa=opacity)
-            background_clip = background_clip.overlay(
-                image_overlay,
-                enable=f"between(t,{current_time},{current_time + audio_clips_durations[i]})",
-                x="(main_w-overlay_w)/2",
-                y="(main_h-overlay_h)/2",
-            )
-            current_time += audio_clips_durations[i]
+        overlays.append((f"assets/temp/{reddit_id}/png/title.png", audio_clips_durations[0]))
+        overlays += [
+            (f"assets/temp/{reddit_id}/png/comment_{i}.png", audio_clips_durations[i + 1])
+            for i in range(number_of_clips)
+        ]
+
+    timeline = prepare_overlay_timeline(overlays, reddit_id, screenshot_width, opacity)
 
     title = re.sub(r"[^\w\s-]", "", reddit_obj["thread_title"])
     idx = re.sub(r"[^\w\s-]", "", reddit_obj["thread_id"])
@@ -316,87 +557,119 @@ def make_final_video(
             print_substep(f"Thumbnail - Building Thumbnail in assets/temp/{reddit_id}/thumbnail.png")
 
     text = f"Background by {background_config['video'][2]}"
-    background_clip = ffmpeg.drawtext(
-        background_clip,
-        text=text,
-        x=f"(w-text_w)",
-        y=f"(h-text_h)",
-        fontsize=5,
-        fontcolor="White",
-        fontfile=os.path.join("fonts", "Roboto-Regular.ttf"),
+    background_stream = next(
+        stream
+        for stream in ffmpeg.probe(f"assets/temp/{reddit_id}/background.mp4")["streams"]
+        if stream["codec_type"] == "video"
     )
-    background_clip = background_clip.filter("scale", W, H)
-    print_step("Rendering the video 🎥")
-    from tqdm import tqdm
-
-    pbar = tqdm(total=100, desc="Progress: ", bar_format="{l_bar}{bar}", unit=" %")
-
-    def on_update_example(progress) -> None:
-        status = round(progress * 100, 2)
-        old_percentage = pbar.n
-        pbar.update(status - old_percentage)
+    # The credit used to be 5px high on the background, see SOURCE_HEIGHT
+    credit = prepare_credit(text, reddit_id, round(5 * H / SOURCE_HEIGHT))
+    background_clip = compose_video(reddit_id, W, H, timeline, credit)
+
+    encoding_config = settings.config["settings"]["encoding"]
+    numerator, denominator = background_stream["avg_frame_rate"].split("/")
+    source_fps = float(numerator) / float(denominator) if float(denominator) else 30
+    profile = encoding_config["encoding_profile"]
+    if profile == "auto":
+        profile = pick_profile(
+            background_clip, reddit_id, float(encoding_config["encoding_quality_floor"]), source_fps
+        )
+    print_substep(f"Encoding with the {profile} profile.")
+    video_args = output_args(PROFILES[profile], source_fps)
 
+    # Other sizes of the video are split off the composed frames, so they share the decode
     defaultPath = f"results/{subreddit}"
-    with ProgressFfmpeg(length, on_update_example) as progress:
-        path = defaultPath + f"/{filename}"
-        path = (
-            path[:251] + ".mp4"
-        )  # Prevent a error by limiting the path length, do not change this.
-        try:
-            ffmpeg.output(
-                background_clip,
-                final_audio,
-                path,
-                f="mp4",
-                **{
-                    "c:v": "h264",
-                    "b:v": "20M",
-                    "b:a": "192k",
-                    "threads": multiprocessing.cpu_count(),
-                },
-            ).overwrite_output().global_args("-progress", progress.output_file.name).run(
-                quiet=True,
-                overwrite_output=True,
-                capture_stdout=False,
-                capture_stderr=False,
+    renditions = [
+        rendition
+        for rendition in parse_renditions(encoding_config["renditions"])
+        if rendition != (W, H)
+    ]
+
+    # A single x264 process stops scaling after a few threads, so big machines encode parts of
+    # the video side by side and join them without re-encoding
+    segment_count = int(encoding_config["parallel_segments"]) or max(
+        1, multiprocessing.cpu_count() // 4
+    )
+    if renditions and segment_count > 1:
+        print_substep("Renditions are encoded in one go, ignoring parallel_segments.")
+        segment_count = 1
+    segments = plan_segments(overlays, length, segment_count, PROFILES[profile]["fps"] or source_fps)
+    if len(segments) > 1:
+        print_step(f"Encoding the video in {len(segments)} parts 🎥")
+        video = ffmpeg.input(
+            render_segments(segments, overlays, reddit_id, W, H, credit, video_args), f="concat"
+        )["v"]
+        video_args = {"c:v": "copy"}
+    else:
+        video = background_clip
+    print_step("Rendering the video 🎥")
+    path = defaultPath + f"/{filename}"
+    path = path[:251] + ".mp4"  # Prevent a error by limiting the path length, do not change this.
+    targets = [(video, final_audio, path)]
+    if renditions:
+        print_substep(f"Also rendering {', '.join(f'{w}x{h}' for w, h in renditions)}.")
+        video_split = video.filter_multi_output("split", len(renditions) + 1)
+        audio_split = final_audio.filter_multi_output("asplit", len(renditions) + 1)
+        targets = [(video_split[0], audio_split[0], path)]
+        for index, (width, height) in enumerate(renditions, start=1):
+            folder = f"{defaultPath}/{width}x{height}"
+            os.makedirs(folder, exist_ok=True)
+            targets.append(
+                (
+                    fit_rendition(video_split[index], width, height),
+                    audio_split[index],
+                    (folder + f"/{filename}")[:251] + ".mp4",
+                )
             )
-        except ffmpeg.Error as e:
-            print(e.stderr.decode("utf8"))
-            exit(1)
-    old_percentage = pbar.n
-    pbar.update(100 - old_percentage)
+    try:
+        run_ffmpeg(
+            ffmpeg.merge_outputs(
+                *(
+                    ffmpeg.output(
+                        target_video,
+                        target_audio,
+                        target_path,
+                        f="mp4",
+                        **video_args,
+                        **{"b:a": "192k", "threads": multiprocessing.cpu_count()},
+                    )
+                    for target_video, target_audio, target_path in targets
+                )
+            ).overwrite_output(),
+            reddit_id,
+            "video",
+            length,
+            [CliProgress(), write_gui_progress, record_metrics],
+        )
+    except ffmpeg.Error as e:
+        print(e.stderr.decode("utf8"))
+        exit(1)
     if allowOnlyTTSFolder:
+        video_path = path
         path = defaultPath + f"/OnlyTTS/{filename}"
         path = (
             path[:251] + ".mp4"
         )  # Prevent a error by limiting the path length, do not change this.
         print_step("Rendering the Only TTS Video 🎥")
-        with ProgressFfmpeg(length, on_update_example) as progress:
-            try:
+        # The video is the same, only the audio differs, so the encoded video is copied over
+        try:
+            run_ffmpeg(
                 ffmpeg.output(
-                    background_clip,
+                    ffmpeg.input(video_path)["v"],
                     audio,
                     path,
                     f="mp4",
-                    **{
-                        "c:v": "h264",
-                        "b:v": "20M",
-                        "b:a": "192k",
-                        "threads": multiprocessing.cpu_count(),
-                    },
-                ).overwrite_output().global_args("-progress", progress.output_file.name).run(
-                    quiet=True,
-                    overwrite_output=True,
-                    capture_stdout=False,
-                    capture_stderr=False,
-                )
-            except ffmpeg.Error as e:
-                print(e.stderr.decode("utf8"))
-                exit(1)
+                    **{"c:v": "copy", "b:a": "192k"},
+                ).overwrite_output(),
+                reddit_id,
+                "only_tts",
+                length,
+                [write_gui_progress, record_metrics],
+            )
+        except ffmpeg.Error as e:
+            print(e.stderr.decode("utf8"))
+            exit(1)
 
-        old_percentage = pbar.n
-        pbar.update(100 - old_percentage)
-    pbar.close()
     save_data(subreddit, filename + ".mp4", title, idx, background_config["video"][2])
     print_step("Removing temporary files 🗑")
     cleanups = cleanup(reddit_id)
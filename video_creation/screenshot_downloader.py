@@ -1,22 +1,174 @@
 import json
+import os
 import re
+import time
 from pathlib import Path
-from typing import Dict, Final
+from typing import Any, Callable, Dict, Final
 
 import translators
+from PIL import Image
 from playwright.async_api import async_playwright  # pylint: disable=unused-import
-from playwright.sync_api import ViewportSize, sync_playwright
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+from playwright.sync_api import ViewportSize
 from rich.progress import track
 
-from utils import settings
+from utils import asset_store, metrics, settings
+from utils.browser_pool import get_browser_pool
 from utils.console import print_step, print_substep
-from utils.imagenarator import imagemaker
-from utils.playwright import clear_cookie_by_name
-
+from utils.imagenarator import cardmaker, imagemaker
+from utils.playwright import (
+    RequestFilter,
+    clear_cookie_by_name,
+    discard_session_state,
+    is_logged_in,
+    load_session_state,
+    save_session_state,
+)
+
+from utils.screenshot_cache import ScreenshotCache
 from utils.videos import save_data
+from video_creation.final_video import card_width
 
 __all__ = ["download_screenshots_of_reddit_posts"]
 
+POST_SELECTOR: Final[str] = '[data-test-id="post-content"]'
+CONTENT_GATE_SELECTOR: Final[str] = '[data-testid="content-gate"]'
+
+
+def wait_for(step: str, wait: Callable[[float], Any], timeout: float, soft: bool = False) -> bool:
+    """Runs a Playwright wait with a deadline and records how long it blocked.
+
+    Args:
+        step (str): Name of the step, the latency is recorded under screenshot.wait.<step>
+        wait (Callable[[float], Any]): The Playwright wait, called with the deadline in milliseconds
+        timeout (float): Deadline of the step in seconds, 0 skips soft steps entirely
+        soft (bool): Whether reaching the deadline is acceptable instead of an error
+
+    Returns:
+        bool: Whether the wait finished before its deadline
+    """
+    if timeout <= 0 and soft:
+        return False  # Playwright treats a timeout of 0 as waiting forever
+    with metrics.timer(f"screenshot.wait.{step}"):
+        try:
+            wait(timeout * 1000)
+        except PlaywrightTimeoutError:
+            if not soft:
+                raise
+            metrics.increment(f"screenshot.wait.{step}.deadline_reached")
+            return False
+    return True
+
+
+def capture_at_width(
+    page, path: str, width: int, legacy_scale: float, locator=None, clip: dict = None
+) -> None:
+    """Takes a screenshot of an element (or of a clip of the page) that is exactly width pixels wide.
+
+    Instead of one oversized device scale factor for the whole page, the scale factor is chosen
+    per screenshot so the image already has the size of its overlay in the final video.
+
+    Args:
+        page (Page): The page to take the screenshot of
+        path (str): Where the PNG is saved
+        width (int): Width of the overlay in the final video
+        legacy_scale (float): The scale factor screenshots used to be taken at, for the report
+        locator (Locator): The element to take a screenshot of
+        clip (dict): The area of the page to take a screenshot of, if no locator is given
+    """
+    box = clip or locator.bounding_box()
+    scale = width / box["width"] if box and box["width"] > 0 else legacy_scale
+    viewport = page.viewport_size
+    asset_store.detach(path)  # the previous image may be linked to the screenshot cache
+    # Chromium drops the override when its session detaches, so it stays until the capture is done
+    cdp = page.context.new_cdp_session(page)
+    try:
+        cdp.send(
+            "Emulation.setDeviceMetricsOverride",
+            {
+                "width": viewport["width"],
+                "height": viewport["height"],
+                "deviceScaleFactor": scale,
+                "mobile": False,
+            },
+        )
+        start = time.perf_counter()
+        if clip:
+            page.screenshot(clip=clip, path=path)
+        else:
+            locator.screenshot(path=path)
+        elapsed = time.perf_counter() - start
+    finally:
+        cdp.detach()
+
+    captured_size = os.path.getsize(path)
+    with Image.open(path) as image:
+        captured_width, captured_height = image.size
+        # The element can be a fraction of a pixel wider than its rounded size
+        if captured_width != width:
+            metrics.increment("screenshot.resized")
+            height = max(1, round(captured_height * width / captured_width))
+            image.resize((width, height), Image.LANCZOS).save(path)
+
+    # PNG size and encode time grow with the pixel count, i.e. the square of the scale factor.
+    # The scale the capture really has is measured, so an override that didn't apply shows up.
+    size = os.path.getsize(path)
+    captured_scale = captured_width / box["width"] if box and box["width"] > 0 else legacy_scale
+    oversize = (legacy_scale / captured_scale) ** 2
+    metrics.observe("screenshot.capture", elapsed)
+    metrics.observe("screenshot.png_size", size, unit="B")
+    metrics.increment("screenshot.png_bytes", size)
+    metrics.increment("screenshot.png_bytes_saved_estimate", max(0, captured_size * (oversize - 1)))
+    metrics.increment("screenshot.encode_seconds_saved_estimate", max(0, elapsed * (oversize - 1)))
+
+
+def get_screenshot_cache_keys(reddit_object: dict, screenshot_num: int) -> Dict[str, str]:
+    """Returns the cache key of every image the screenshot stage produces for a post.
+
+    Args:
+        reddit_object (Dict): Reddit object received from reddit/subreddit.py
+        screenshot_num (int): Number of comment screenshots
+
+    Returns:
+        Dict[str, str]: The cache key of each image, by file name
+    """
+    render_params = {
+        "theme": settings.config["settings"]["theme"],
+        "storymode": settings.config["settings"]["storymode"],
+        "zoom": settings.config["settings"]["zoom"],
+        "resolution": [
+            settings.config["settings"]["resolution_w"],
+            settings.config["settings"]["resolution_h"],
+        ],
+        "lang": settings.config["reddit"]["thread"]["post_lang"],
+        "method": settings.config["settings"]["screenshot_method"],
+        "width": card_width(
+            int(settings.config["settings"]["resolution_w"]),
+            int(settings.config["settings"]["resolution_h"]),
+        ),
+    }
+    thread_id = reddit_object["thread_id"]
+    thread_edited = reddit_object["thread_edited"]
+    keys = {"title.png": ScreenshotCache.key(thread_id, thread_edited, **render_params)}
+    if settings.config["settings"]["storymode"]:
+        keys["story_content.png"] = ScreenshotCache.key(
+            thread_id, thread_edited, content="story", **render_params
+        )
+        return keys
+    for idx, comment in enumerate(reddit_object["comments"][:screenshot_num]):
+        keys[f"comment_{idx}.png"] = ScreenshotCache.key(
+            comment["comment_id"], comment["comment_edited"], **render_params
+        )
+    return keys
+
+
+def store_screenshots(cache: ScreenshotCache, keys: Dict[str, str], reddit_id: str) -> None:
+    """Adds the freshly rendered images of a post to the screenshot cache"""
+    for filename, key in keys.items():
+        path = f"assets/temp/{reddit_id}/png/{filename}"
+        if Path(path).is_file():
+            cache.put(key, path)
+
 
 def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
     """Downloads screenshots of reddit posts as seen on the web. Downloads to assets/temp/png
@@ -28,8 +180,14 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
     # settings values
     W: Final[int] = int(settings.config["settings"]["resolution_w"])
     H: Final[int] = int(settings.config["settings"]["resolution_h"])
+    # The width the images are overlaid with in the final video
+    overlay_width: Final[int] = card_width(W, H)
     lang: Final[str] = settings.config["reddit"]["thread"]["post_lang"]
     storymode: Final[bool] = settings.config["settings"]["storymode"]
+    browser_config = settings.config["settings"]["browser"]
+    page_load_timeout: Final[float] = float(browser_config["page_load_timeout"])
+    element_timeout: Final[float] = float(browser_config["element_timeout"])
+    network_idle_timeout: Final[float] = float(browser_config["network_idle_timeout"])
 
     print_step("Downloading screenshots of reddit posts...")
     reddit_id = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
@@ -68,144 +226,268 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
             reddit_obj=reddit_object,
             txtclr=txtcolor,
             transparent=transparent,
+            width=overlay_width,
         )
 
-    screenshot_num: int
-    with sync_playwright() as p:
-        print_substep("Launching Headless Browser...")
-
-        browser = p.chromium.launch(
-            headless=True
-        )  # headless=False will show the browser for debugging purposes
-        # Device scale factor (or dsf for short) allows us to increase the resolution of the screenshots
-        # When the dsf is 1, the width of the screenshot is 600 pixels
-        # so we need a dsf such that the width of the screenshot is greater than the final resolution of the video
-        dsf = (W // 600) + 1
-
-        context = browser.new_context(
-            locale=lang or "en-us",
-            color_scheme="dark",
-            viewport=ViewportSize(width=W, height=H),
-            device_scale_factor=dsf,
+    # Restore the images that were already rendered for an earlier video
+    missing = get_screenshot_cache_keys(reddit_object, screenshot_num)
+    cache = None
+    if settings.config["settings"]["screenshot_cache_size"]:
+        cache = ScreenshotCache(int(settings.config["settings"]["screenshot_cache_size"]))
+        missing = {
+            filename: key
+            for filename, key in missing.items()
+            if not cache.get(key, f"assets/temp/{reddit_id}/png/{filename}")
+        }
+        if not missing:
+            cookie_file.close()
+            print_substep("All screenshots were cached, skipping the browser.", style="bold green")
+            return
+
+    if settings.config["settings"]["screenshot_method"] == "native":
+        # Draw the cards from the data praw already fetched, no browser or login needed
+        cookie_file.close()
+        print_substep("Rendering comment cards...")
+        cardmaker(
+            theme=bgcolor,
+            reddit_obj=reddit_object,
+            txtclr=txtcolor,
+            width=overlay_width,
+            screenshot_num=screenshot_num,
+            missing=missing,
         )
+        if cache:
+            store_screenshots(cache, missing, reddit_id)
+        print_substep("Comment cards rendered Successfully.", style="bold green")
+        return
+
+    screenshot_num: int
+    # Device scale factor (or dsf for short) allows us to increase the resolution of the screenshots
+    # When the dsf is 1, the width of the screenshot is 600 pixels.
+    # Every screenshot picks its own scale factor so it's exactly as wide as its overlay in the
+    # final video, this one is only used for the pages in between.
+    dsf = (W // 600) + 1
+
+    username = settings.config["reddit"]["creds"]["username"]
+    if str(username).casefold().startswith("u/"):
+        username = username[2:]
+    session_state = load_session_state(username)
+
+    # The browser stays warm in the pool, only the context is created for this video
+    with get_browser_pool().context(
+        locale=lang or "en-us",
+        color_scheme="dark",
+        viewport=ViewportSize(width=W, height=H),
+        device_scale_factor=dsf,
+        storage_state=session_state,
+    ) as context:
         cookies = json.load(cookie_file)
         cookie_file.close()
 
         context.add_cookies(cookies)  # load preference cookies
 
-        # Login to Reddit
-        print_substep("Logging in to Reddit...")
-        page = context.new_page()
-        page.goto("https://www.reddit.com/login", timeout=0)
-        page.set_viewport_size(ViewportSize(width=1920, height=1080))
-        page.wait_for_load_state()
-
-        page.locator('[name="username"]').fill(settings.config["reddit"]["creds"]["username"])
-        page.locator('[name="password"]').fill(settings.config["reddit"]["creds"]["password"])
-        page.locator("button[class$='m-full-width']").click()
-        page.wait_for_timeout(5000)
-
-        login_error_div = page.locator(".AnimatedForm__errorMessage").first
-        if login_error_div.is_visible():
-            login_error_message = login_error_div.inner_text()
-            if login_error_message.strip() == "":
-                # The div element is empty, no error
-                pass
-            else:
-                # The div contains an error message
-                print_substep(
-                    "Your reddit credentials are incorrect! Please modify them accordingly in the config.toml file.",
-                    style="red",
-                )
-                exit()
-        else:
-            pass
-
-        page.wait_for_load_state()
-        # Handle the redesign
-        # Check if the redesign optout cookie is set
-        if page.locator("#redesign-beta-optin-btn").is_visible():
-            # Clear the redesign optout cookie
-            clear_cookie_by_name(context, "redesign_optout")
-            # Reload the page for the redesign to take effect
-            page.reload()
-        # Get the thread screenshot
-        page.goto(reddit_object["thread_url"], timeout=0)
-        page.set_viewport_size(ViewportSize(width=W, height=H))
-        page.wait_for_load_state()
-        page.wait_for_timeout(5000)
+        # Skip downloading media, ads and trackers that never end up in the screenshots
+        request_filter = None
+        if browser_config["block_requests"]:
+            request_filter = RequestFilter(
+                block_fonts=browser_config["block_fonts"],
+                allowlist=[
+                    domain.strip()
+                    for domain in str(browser_config["request_allowlist"]).split(",")
+                    if domain.strip()
+                ],
+                collect_stats=browser_config["request_stats"],
+            )
 
-        if page.locator(
-            "#t3_12hmbug > div > div._3xX726aBn29LDbsDtzr_6E._1Ap4F5maDtT1E1YuCiaO0r.D3IL3FD0RFy_mkKLPwL4 > div > div > button"
-        ).is_visible():
-            # This means the post is NSFW and requires to click the proceed button.
+        def new_page():
+            page = context.new_page()
+            if request_filter:
+                request_filter.attach(page)
+            return page
 
-            print_substep("Post is NSFW. You are spicy...")
-            page.locator(
-                "#t3_12hmbug > div > div._3xX726aBn29LDbsDtzr_6E._1Ap4F5maDtT1E1YuCiaO0r.D3IL3FD0RFy_mkKLPwL4 > div > div > button"
-            ).click()
-            page.wait_for_load_state()  # Wait for page to fully load
-
-            # translate code
-        if page.locator(
-            "#SHORTCUT_FOCUSABLE_DIV > div:nth-child(7) > div > div > div > header > div > div._1m0iFpls1wkPZJVo38-LSh > button > i"
-        ).is_visible():
-            page.locator(
-                "#SHORTCUT_FOCUSABLE_DIV > div:nth-child(7) > div > div > div > header > div > div._1m0iFpls1wkPZJVo38-LSh > button > i"
-            ).click()  # Interest popup is showing, this code will close it
-
-        if lang:
-            print_substep("Translating post...")
-            texts_in_tl = translators.translate_text(
-                reddit_object["thread_title"],
-                to_language=lang,
-                translator="google",
+        if session_state and is_logged_in(context, username):
+            print_substep("Reusing saved Reddit session...")
+            page = new_page()
+        else:
+            if session_state:
+                # The session was revoked or belongs to old credentials
+                discard_session_state(username)
+            # Login to Reddit
+            print_substep("Logging in to Reddit...")
+            page = new_page()
+            page.set_viewport_size(ViewportSize(width=1920, height=1080))
+            wait_for(
+                "login_page",
+                lambda ms: page.goto(
+                    "https://www.reddit.com/login", timeout=ms, wait_until="domcontentloaded"
+                ),
+                page_load_timeout,
+            )
+            wait_for(
+                "login_form",
+                lambda ms: page.locator('[name="username"]').wait_for(timeout=ms),
+                element_timeout,
             )
 
-            page.evaluate(
-                "tl_content => document.querySelector('[data-adclicklocation=\"title\"] > div > div > h1').textContent = tl_content",
-                texts_in_tl,
+            page.locator('[name="username"]').fill(username)
+            page.locator('[name="password"]').fill(settings.config["reddit"]["creds"]["password"])
+            page.locator("button[class$='m-full-width']").click()
+            # Reddit leaves the login page once the credentials are accepted,
+            # if they aren't the error message is checked below
+            wait_for(
+                "login",
+                lambda ms: page.wait_for_url(lambda url: "/login" not in url, timeout=ms),
+                page_load_timeout,
+                soft=True,
             )
-        else:
-            print_substep("Skipping translation...")
 
-        postcontentpath = f"assets/temp/{reddit_id}/png/title.png"
-        try:
-            if settings.config["settings"]["zoom"] != 1:
-                # store zoom settings
-                zoom = settings.config["settings"]["zoom"]
-                # zoom the body of the page
-                page.evaluate("document.body.style.zoom=" + str(zoom))
-                # as zooming the body doesn't change the properties of the divs, we need to adjust for the zoom
-                location = page.locator('[data-test-id="post-content"]').bounding_box()
-                for i in location:
-                    location[i] = float("{:.2f}".format(location[i] * zoom))
-                page.screenshot(clip=location, path=postcontentpath)
+            login_error_div = page.locator(".AnimatedForm__errorMessage").first
+            if login_error_div.is_visible():
+                login_error_message = login_error_div.inner_text()
+                if login_error_message.strip() == "":
+                    # The div element is empty, no error
+                    pass
+                else:
+                    # The div contains an error message
+                    print_substep(
+                        "Your reddit credentials are incorrect! Please modify them accordingly in the config.toml file.",
+                        style="red",
+                    )
+                    exit()
             else:
-                page.locator('[data-test-id="post-content"]').screenshot(path=postcontentpath)
-        except Exception as e:
-            print_substep("Something went wrong!", style="red")
-            resp = input(
-                "Something went wrong with making the screenshots! Do you want to skip the post? (y/n) "
+                pass
+
+            # Handle the redesign
+            # Check if the redesign optout cookie is set
+            if page.locator("#redesign-beta-optin-btn").is_visible():
+                # Clear the redesign optout cookie
+                clear_cookie_by_name(context, "redesign_optout")
+                # Reload the page for the redesign to take effect
+                page.reload()
+            # Save the session so the next runs don't have to log in again
+            save_session_state(context, username)
+            if request_filter:
+                request_filter.report_page("login")
+
+        page.set_viewport_size(ViewportSize(width=W, height=H))
+        # Get the thread screenshot
+        # Images restored from the cache don't need the thread page, the comments have their own
+        if "title.png" in missing or "story_content.png" in missing:
+            wait_for(
+                "thread_page",
+                lambda ms: page.goto(
+                    reddit_object["thread_url"], timeout=ms, wait_until="domcontentloaded"
+                ),
+                page_load_timeout,
+            )
+            wait_for(
+                "post",
+                lambda ms: page.locator(f"{POST_SELECTOR}, {CONTENT_GATE_SELECTOR}").first.wait_for(
+                    timeout=ms
+                ),
+                element_timeout,
+            )
+            wait_for(
+                "thread_network_idle",
+                lambda ms: page.wait_for_load_state("networkidle", timeout=ms),
+                network_idle_timeout,
+                soft=True,
             )
 
-            if resp.casefold().startswith("y"):
-                save_data("", "", "skipped", reddit_id, "")
-                print_substep(
-                    "The post is successfully skipped! You can now restart the program and this post will skipped.",
-                    "green",
+            if page.locator(
+                "#t3_12hmbug > div > div._3xX726aBn29LDbsDtzr_6E._1Ap4F5maDtT1E1YuCiaO0r.D3IL3FD0RFy_mkKLPwL4 > div > div > button"
+            ).is_visible():
+                # This means the post is NSFW and requires to click the proceed button.
+
+                print_substep("Post is NSFW. You are spicy...")
+                page.locator(
+                    "#t3_12hmbug > div > div._3xX726aBn29LDbsDtzr_6E._1Ap4F5maDtT1E1YuCiaO0r.D3IL3FD0RFy_mkKLPwL4 > div > div > button"
+                ).click()
+                wait_for(
+                    "post",
+                    lambda ms: page.locator(POST_SELECTOR).wait_for(timeout=ms),
+                    element_timeout,
                 )
 
-            resp = input("Do you want the error traceback for debugging purposes? (y/n)")
-            if not resp.casefold().startswith("y"):
-                exit()
+                # translate code
+            if page.locator(
+                "#SHORTCUT_FOCUSABLE_DIV > div:nth-child(7) > div > div > div > header > div > div._1m0iFpls1wkPZJVo38-LSh > button > i"
+            ).is_visible():
+                page.locator(
+                    "#SHORTCUT_FOCUSABLE_DIV > div:nth-child(7) > div > div > div > header > div > div._1m0iFpls1wkPZJVo38-LSh > button > i"
+                ).click()  # Interest popup is showing, this code will close it
+
+            if lang:
+                print_substep("Translating post...")
+                texts_in_tl = translators.translate_text(
+                    reddit_object["thread_title"],
+                    to_language=lang,
+                    translator="google",
+                )
 
-            raise e
+                page.evaluate(
+                    "tl_content => document.querySelector('[data-adclicklocation=\"title\"] > div > div > h1').textContent = tl_content",
+                    texts_in_tl,
+                )
+            else:
+                print_substep("Skipping translation...")
+
+        if "title.png" in missing:
+            postcontentpath = f"assets/temp/{reddit_id}/png/title.png"
+            try:
+                if settings.config["settings"]["zoom"] != 1:
+                    # store zoom settings
+                    zoom = settings.config["settings"]["zoom"]
+                    # zoom the body of the page
+                    page.evaluate("document.body.style.zoom=" + str(zoom))
+                    # as zooming the body doesn't change the properties of the divs, we need to adjust for the zoom
+                    location = page.locator(POST_SELECTOR).bounding_box()
+                    for i in location:
+                        location[i] = float("{:.2f}".format(location[i] * zoom))
+                    capture_at_width(page, postcontentpath, overlay_width, dsf, clip=location)
+                else:
+                    capture_at_width(
+                        page,
+                        postcontentpath,
+                        overlay_width,
+                        dsf,
+                        locator=page.locator(POST_SELECTOR),
+                    )
+            except Exception as e:
+                print_substep("Something went wrong!", style="red")
+                resp = input(
+                    "Something went wrong with making the screenshots! Do you want to skip the post? (y/n) "
+                )
+
+                if resp.casefold().startswith("y"):
+                    save_data("", "", "skipped", reddit_id, "")
+                    print_substep(
+                        "The post is successfully skipped! You can now restart the program and this post will skipped.",
+                        "green",
+                    )
+
+                resp = input("Do you want the error traceback for debugging purposes? (y/n)")
+                if not resp.casefold().startswith("y"):
+                    exit()
+
+                raise e
+
+            if request_filter and request_filter.collect_stats:
+                report = request_filter.report_page("title")
+                print_substep(
+                    f"Blocked {report['blocked_requests']} requests, "
+                    f"loaded {report['loaded_bytes'] // 1024} KB for the post"
+                )
 
         if storymode:
-            page.locator('[data-click-id="text"]').first.screenshot(
-                path=f"assets/temp/{reddit_id}/png/story_content.png"
-            )
+            if "story_content.png" in missing:
+                capture_at_width(
+                    page,
+                    f"assets/temp/{reddit_id}/png/story_content.png",
+                    overlay_width,
+                    dsf,
+                    locator=page.locator('[data-click-id="text"]').first,
+                )
         else:
             for idx, comment in enumerate(
                 track(
@@ -217,10 +499,38 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
                 if idx >= screenshot_num:
                     break
 
-                if page.locator('[data-testid="content-gate"]').is_visible():
-                    page.locator('[data-testid="content-gate"] button').click()
+                if f"comment_{idx}.png" not in missing:
+                    continue  # restored from the cache
+
+                if page.locator(CONTENT_GATE_SELECTOR).is_visible():
+                    page.locator(f"{CONTENT_GATE_SELECTOR} button").click()
 
-                page.goto(f'https://reddit.com{comment["comment_url"]}', timeout=0)
+                try:
+                    wait_for(
+                        "comment_page",
+                        lambda ms: page.goto(
+                            f'https://reddit.com{comment["comment_url"]}',
+                            timeout=ms,
+                            wait_until="domcontentloaded",
+                        ),
+                        page_load_timeout,
+                    )
+                    wait_for(
+                        "comment",
+                        lambda ms: page.locator(f"#t1_{comment['comment_id']}").wait_for(timeout=ms),
+                        element_timeout,
+                    )
+                    wait_for(
+                        "comment_network_idle",
+                        lambda ms: page.wait_for_load_state("networkidle", timeout=ms),
+                        network_idle_timeout,
+                        soft=True,
+                    )
+                except PlaywrightTimeoutError:
+                    print_substep(
+                        f"Comment {comment['comment_id']} didn't load in time.", style="red"
+                    )
+                    raise
 
                 # translate code
 
@@ -246,21 +556,36 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
                         location = page.locator(f"#t1_{comment['comment_id']}").bounding_box()
                         for i in location:
                             location[i] = float("{:.2f}".format(location[i] * zoom))
-                        page.screenshot(
+                        capture_at_width(
+                            page,
+                            f"assets/temp/{reddit_id}/png/comment_{idx}.png",
+                            overlay_width,
+                            dsf,
                             clip=location,
-                            path=f"assets/temp/{reddit_id}/png/comment_{idx}.png",
                         )
                     else:
-                        page.locator(f"#t1_{comment['comment_id']}").screenshot(
-                            path=f"assets/temp/{reddit_id}/png/comment_{idx}.png"
+                        capture_at_width(
+                            page,
+                            f"assets/temp/{reddit_id}/png/comment_{idx}.png",
+                            overlay_width,
+                            dsf,
+                            locator=page.locator(f"#t1_{comment['comment_id']}"),
                         )
-                except TimeoutError:
-                    del reddit_object["comments"]
-                    screenshot_num += 1
-                    print("TimeoutError: Skipping screenshot...")
-                    continue
-
-        # close browser instance when we are done using it
-        browser.close()
-
+                    if request_filter:
+                        request_filter.report_page(f"comment_{idx}")
+                except PlaywrightTimeoutError:
+                    print_substep(
+                        f"Comment {comment['comment_id']} couldn't be captured in time.", style="red"
+                    )
+                    raise
+
+    if cache:
+        store_screenshots(cache, missing, reddit_id)
+    saved = metrics.summary()["counters"]
+    print_substep(
+        f"Screenshots take {saved.get('screenshot.png_bytes', 0) // 1024:.0f} KB, about "
+        f"{saved.get('screenshot.png_bytes_saved_estimate', 0) // 1024:.0f} KB and "
+        f"{saved.get('screenshot.encode_seconds_saved_estimate', 0):.1f}s of PNG encoding "
+        "less than at a fixed scale factor."
+    )
     print_substep("Screenshots downloaded Successfully.", style="bold green")